@@ -11,6 +11,17 @@
 #
 ##############################################################################
 
+from array import array
+from collections import namedtuple
+from bisect import bisect_left
+from bisect import bisect_right
+from heapq import heappop
+from heapq import heappush
+from itertools import islice
+import pickle
+import time
+
+from BTrees.LOBTree import LOBTree
 from persistent import Persistent
 from zope.interface import implementer
 from ZODB.POSException import ConflictError
@@ -19,51 +30,239 @@ from ZODB.POSException import ConflictError
 from appendonly.interfaces import IAppendStack
 
 
-class _LayerFull(ValueError):
-    pass
+def _countUp(start, stop):
+    # Lazy 'range' on both Python 2 and 3.
+    while start < stop:
+        yield start
+        start = start + 1
+
+
+def _countDown(start, stop):
+    while start > stop:
+        yield start
+        start = start - 1
+
+
+_marker = object()
+
+
+def _prefetch(objects):
+    """ Ask the database to load any ghosts among `objects` in one batch.
+
+    - A no-op for objects not yet added to a database (or not persistent,
+      e.g. a `History`), or where the connection (or its storage) doesn't
+      support prefetching.
+    """
+    ghosts = [x for x in objects
+              if getattr(x, '_p_jar', None) is not None
+                and x._p_changed is None]
+    if ghosts:
+        prefetch = getattr(ghosts[0]._p_jar, 'prefetch', None)
+        if prefetch is not None:
+            prefetch(ghosts)
+
+
+def _prefetching(layers, depth):
+    """ Yield from `layers`, prefetching the next `depth` ahead of time.
+
+    - While the current batch of `depth` layers is being consumed, the next
+      batch has already been requested from the database.
+    """
+    layers = iter(layers)
+    if not depth:
+        for layer in layers:
+            yield layer
+        return
+    batch = list(islice(layers, depth))
+    _prefetch(batch)
+    while batch:
+        following = list(islice(layers, depth))
+        _prefetch(following)
+        for layer in batch:
+            yield layer
+        batch = following
+
+
+def _layerItem(layer, generation, index):
+    # Return the item at `index` in `layer`, or `_marker` if not found.
+    if layer is None or layer._generation != generation:
+        return _marker
+    stack = layer._stack
+    if 0 <= index < len(stack):
+        return stack[index]
+    return _marker
+
+
+def _layerRange(layer, start, stop, reverse):
+    """ Yield (index, object) from `layer` within (generation, index) bounds.
+
+    - `start` is inclusive, `stop` is exclusive;  either may be None.
+    """
+    generation = layer._generation
+    lo = hi = None
+    if start is not None and start[0] == generation:
+        lo = start[1]
+    if stop is not None:
+        if stop[0] < generation:
+            return iter(())
+        if stop[0] == generation:
+            hi = stop[1]
+    return layer._range(lo or 0, hi, reverse)
 
 
 class _LayerBase(object):
     """ Base for both _Layer and _ArchiveLayer.
+
+    - If passed, `items` is adopted as the layer's storage, without copying.
     """
-    def __init__(self, max_length=100, generation=0):
-        self._stack = []
+    __slots__ = ()
+
+    def __init__(self, max_length=100, generation=0, items=None):
+        self._stack = [] if items is None else items
         self._max_length = max_length
         self._generation = generation
 
     def __iter__(self):
-        at = len(self._stack)
-        while at > 0:
-            at = at - 1
-            yield at, self._stack[at]
+        return self._range(reverse=True)
+
+    def _range(self, start=0, stop=None, reverse=False):
+        """ Yield (index, object) tuples for indexes in [`start`, `stop`).
+
+        - Yield oldest-first, or most-recent first if `reverse` is true.
+        """
+        stack = self._stack
+        start = max(start, 0)
+        if stop is None or stop > len(stack):
+            stop = len(stack)
+        if reverse:
+            at = stop
+            while at > start:
+                at = at - 1
+                yield at, stack[at]
+        else:
+            at = start
+            while at < stop:
+                yield at, stack[at]
+                at = at + 1
 
     def newer(self, latest_index):
         """ Yield items appended after `latest_index`.
         
         Implemented as a method on the layer to work around lack of generator
         expressions in Python 2.5.x.
+
+        Indexes are dense, so we count down to `latest_index` rather than
+        comparing each item's index against it.
         """
-        for index, obj in self:
-            if index <= latest_index:
-                break
-            yield index, obj
+        stack = self._stack
+        floor = max(latest_index + 1, 0)
+        at = len(stack)
+        while at > floor:
+            at = at - 1
+            yield at, stack[at]
 
 
 class _Layer(_LayerBase):
     """ Append-only list with maximum length.
 
-    - Raise `_LayerFull` on attempts to exceed that length.
+    - `AppendStack` checks the length before appending, and adds a new layer
+      once the head layer is full.
 
     - Iteration occurs in reverse order of appends, and yields (index, object)
       tuples.
 
     - Hold generation (a sequence number) on behalf of `AppendStack`.
+
+    - Slotted, since a stack in the ZODB cache holds many of them.
     """
+    __slots__ = ('_stack', '_max_length', '_generation')
 
-    def push(self, obj):
-        if len(self._stack) >= self._max_length:
-            raise _LayerFull()
-        self._stack.append(obj)
+
+class Cursor(namedtuple('Cursor', 'generation index')):
+    """ Key of the most recent item a reader has seen in a stack.
+
+    - Returned by `AppendStack.poll`.  `token` serializes the cursor as a
+      string;  `fromToken` parses one.
+    """
+    __slots__ = ()
+
+    def token(self):
+        return '%d:%d' % self
+
+    @classmethod
+    def fromToken(klass, token):
+        try:
+            generation, index = token.split(':')
+            return klass(int(generation), int(index))
+        except (AttributeError, ValueError):
+            raise ValueError('Invalid cursor token: %r' % (token,))
+
+
+def _pickledSize(items):
+    return len(pickle.dumps(items, 2))
+
+
+class Retention(object):
+    """ Policy bounding the layers an AppendStack retains by size or age.
+
+    - Pass as `retention` to `AppendStack.push` / `push_many`.  Layers it
+      rejects are pruned oldest-first, through the `pruner`, as are those
+      beyond `max_layers`.  The head layer is always retained.
+
+    - `max_bytes` bounds the total size of the retained layers' items, as
+      measured by `sizer(items)` (by default, the length of their pickle).
+      It is checked only when a push adds a new layer.
+
+    - `max_age` bounds the age, in seconds of `clock()`, of the oldest
+      retained layer's newest item, as returned by `timestamp(item)`.  It
+      is checked on every push.
+
+    - Each full layer is measured once:  the stack keeps its size and
+      newest timestamp in its own record, so that later checks load
+      neither that layer nor its items.
+    """
+    def __init__(self, max_bytes=None, max_age=None, timestamp=None,
+                 sizer=_pickledSize, clock=time.time):
+        if max_age is not None and timestamp is None:
+            raise ValueError('max_age requires a timestamp function')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.timestamp = timestamp
+        self.sizer = sizer
+        self.clock = clock
+
+    def retained(self, stack, count, rolled_over=True):
+        """ Return how many of the newest `count` layers of `stack` to keep.
+
+        - Check `max_bytes` only if `rolled_over` is true.
+        """
+        if self.max_age is not None:
+            cutoff = self.clock() - self.max_age
+            while count > 1:
+                newest = stack._layerInfo(count - 1, self)[1]
+                if newest is not None and newest >= cutoff:
+                    break
+                count -= 1
+        if rolled_over and self.max_bytes is not None:
+            total = 0
+            for at in range(count):
+                total += stack._layerInfo(at, self)[0]
+                if total > self.max_bytes:
+                    count = max(at, 1)
+                    break
+        return count
+
+    def measure(self, items):
+        """ Return (size, newest timestamp) for a layer's `items`.
+
+        - Either is None if the corresponding limit is not set.
+        """
+        size = newest = None
+        if self.max_bytes is not None:
+            size = self.sizer(items)
+        if self.max_age is not None and len(items):
+            newest = self.timestamp(items[-1])
+        return size, newest
 
 
 @implementer(IAppendStack)
@@ -80,55 +279,333 @@ class AppendStack(Persistent):
       (generation, index, object) tuples.
     """
 
-    def __init__(self, max_layers=10, max_length=100):
+    _layer_factory = _Layer
+    _typecode = None
+    _layer_info = None      # generation -> (size, newest):  see Retention
+
+    def __init__(self, max_layers=10, max_length=100, typecode=None):
         self._max_layers = max_layers
         self._max_length = max_length
-        self._layers = [_Layer(max_length, generation=0)]
+        self._typecode = typecode
+        self._layers = [self._newLayer(0)]
 
     def __iter__(self):
         """ See IAppendStack.
         """
-        for layer in self._layers:
+        for at in range(len(self._layers)):
+            layer = self._getLayer(at)
             for index, item in layer:
                 yield layer._generation, index, item
 
-    def newer(self, latest_gen, latest_index):
+    def __getitem__(self, key):
+        """ See IAppendStack.
+        """
+        generation, index = key
+        pos = self._layerPosition(generation)
+        if 0 <= pos < len(self._layers):
+            found = _layerItem(self._getLayer(pos), generation, index)
+            if found is not _marker:
+                return found
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        """ See IAppendStack.
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def newer(self, latest_gen, latest_index, limit=None):
         """ See IAppendStack.
         """
-        for gen, index, obj in self:
-            if (gen, index) <= (latest_gen, latest_index):
+        if limit is not None and limit <= 0:
+            return
+        pos = self._layerPosition(latest_gen)
+        count = 0
+        for at in range(min(pos + 1, len(self._layers))):
+            layer = self._getLayer(at)
+            if layer._generation == latest_gen:
+                items = layer.newer(latest_index)
+            elif layer._generation < latest_gen:
                 break
-            yield gen, index, obj
+            else:
+                items = layer
+            for index, obj in items:
+                yield layer._generation, index, obj
+                count += 1
+                if count == limit:
+                    return
+
+    def iter_range(self, start=None, stop=None, reverse=False):
+        """ See IAppendStack.
+        """
+        count = len(self._layers)
+        if start is None:
+            oldest = count - 1
+        else:
+            oldest = self._layerPosition(start[0])
+            if oldest < 0:
+                return
+            if oldest == count or self._generationAt(oldest) != start[0]:
+                oldest = oldest - 1
+        if stop is None:
+            newest = 0
+        else:
+            newest = max(self._layerPosition(stop[0]), 0)
+        if reverse:
+            positions = _countUp(newest, oldest + 1)
+        else:
+            positions = _countDown(oldest, newest - 1)
+        for at in positions:
+            layer = self._getLayer(at)
+            generation = layer._generation
+            for index, item in _layerRange(layer, start, stop, reverse):
+                yield generation, index, item
+
+    def poll(self, cursor=None, limit=None):
+        """ See IAppendStack.
+        """
+        cursor = Cursor(-1, -1) if cursor is None else Cursor(*cursor)
+        # Layers may hold more than '_max_length' items (see
+        # '_p_resolveConflict'), so we can't tell whether the reader saw all
+        # of a pruned layer:  the reader may have missed items unless it
+        # had not yet started a layer we still retain.
+        oldest_gen = self._generationAt(len(self._layers) - 1)
+        if cursor.index < 0:
+            gap = max(cursor.generation, 0) < oldest_gen
+        else:
+            gap = cursor.generation < oldest_gen
+        items = list(islice(
+            self.iter_range(start=(cursor.generation, cursor.index + 1)),
+            limit))
+        if items:
+            cursor = Cursor(items[-1][0], items[-1][1])
+        return items, cursor, gap
+
+    def _getLayer(self, at):
+        """ Return the layer at position `at`, materializing it if needed.
+
+        - `__setstate__` leaves layers as the unpickled (generation, items)
+          tuples;  we replace each with a layer object on first access.
+        """
+        layer = self._layers[at]
+        if type(layer) is tuple:
+            generation, items = layer
+            if self._typecode is not None:
+                items = _fromBytes(self._typecode, items)
+            layer = self._layers[at] = _Layer(self._max_length,
+                                              generation, items)
+        return layer
+
+    def _layerInfo(self, at, retention):
+        """ Return (size, newest timestamp) of the layer at `at`.
+
+        - Measured by `retention` (see `Retention.measure`).  Full layers
+          no longer change:  keep their measurements, by generation, in our
+          record, rather than loading them again.
+        """
+        if at == 0: # the head layer may still grow
+            return retention.measure(self._getLayer(0)._stack)
+        generation = self._generationAt(at)
+        info = self._layer_info
+        if info is None:
+            info = self._layer_info = {}
+        size, newest = found = info.get(generation, (None, None))
+        if ((size is None and retention.max_bytes is not None) or
+                (newest is None and retention.max_age is not None)):
+            m_size, m_newest = retention.measure(self._getLayer(at)._stack)
+            if size is None:
+                size = m_size
+            if newest is None:
+                newest = m_newest
+            found = info[generation] = (size, newest)
+            self._p_changed = True
+        return found
+
+    def _generationAt(self, at):
+        # Return the generation of the layer at `at`, without materializing.
+        layer = self._layers[at]
+        if type(layer) is tuple:
+            return layer[0]
+        return layer._generation
+
+    def _layerPosition(self, generation):
+        """ Return the position in `_layers` of the layer for `generation`.
+
+        - Return -1 if `generation` is newer than the head layer.
+
+        - Return `len(self._layers)` if it is older than the oldest layer.
+
+        - Otherwise, return the position of the layer holding `generation`,
+          or of the newest layer older than it, if no layer holds it.
 
-    def push(self, obj, pruner=None):
+        Layers are normally numbered contiguously, so the offset from the
+        head's generation finds the layer directly;  we fall back to a
+        binary search over the (descending) generations otherwise.
+        """
+        count = len(self._layers)
+        generationAt = self._generationAt
+        head_gen = generationAt(0)
+        if generation > head_gen:
+            return -1
+        if generation < generationAt(count - 1):
+            return count
+        pos = head_gen - generation
+        if pos < count and generationAt(pos) == generation:
+            return pos
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if generationAt(mid) > generation:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def push(self, obj, pruner=None, retention=None):
+        """ See IAppendStack.
+        """
+        head = self._layers[0]
+        if type(head) is tuple:
+            head = self._getLayer(0)
+        stack = head._stack
+        if len(stack) < self._max_length:
+            stack.append(obj)
+            if type(head) is _Layer:
+                # Fast path:  the layer is saved in our own record.
+                self._p_changed = True
+            else:
+                self._layerChanged(head)
+            if retention is not None:
+                self._prune(pruner, retention, rolled_over=False)
+        else:
+            layers = self._layers
+            layers.insert(0, self._newLayer(head._generation + 1, [obj]))
+            if retention is not None or len(layers) > self._max_layers:
+                self._prune(pruner, retention)
+            self._p_changed = True
+
+    def push_many(self, objs, pruner=None, retention=None):
         """ See IAppendStack.
         """
+        max_length = self._max_length
+        if self._typecode is not None:
+            # Check every item before changing any layer.
+            objs = array(_arrayTypecode(self._typecode), objs)
+        objs = iter(objs)
+        head = self._getLayer(0)
+        room = max_length - len(head._stack)
+        if room > 0:
+            # Take the items before changing the layer, in case 'objs'
+            # raises.
+            chunk = list(islice(objs, room))
+            if chunk:
+                head._stack.extend(chunk)
+                self._layerChanged(head)
+        added = []
+        generation = head._generation
+        while True:
+            chunk = list(islice(objs, max_length))
+            if not chunk:
+                break
+            generation = generation + 1
+            added.append(self._newLayer(generation, chunk))
+        if added:
+            added.reverse()
+            self._layers[:0] = added
+            self._prune(pruner, retention)
+            self._p_changed = True
+        elif retention is not None:
+            self._prune(pruner, retention, rolled_over=False)
+
+    def _newLayer(self, generation, items=None):
+        if self._typecode is not None:
+            items = array(_arrayTypecode(self._typecode), items or ())
+        return self._layer_factory(self._max_length, generation, items)
+
+    def _layerChanged(self, layer):
+        # Our layers are saved in our own record.
+        self._p_changed = True
+
+    def _prune(self, pruner, retention=None, rolled_over=True):
+        """ Discard layers beyond `_max_layers`, passing them to `pruner`.
+
+        - Also discard layers rejected by `retention`, if passed (see
+          `Retention.retained`).
+
+        - Pruned layers are passed oldest-first, so that `Archive.addLayer`
+          (or `Archive.adoptLayer`) can be used as the pruner.
+        """
         layers = self._layers
+        count = len(layers)
         max = self._max_layers
-        try:
-            layers[0].push(obj)
-        except _LayerFull:
-            new_layer = _Layer(self._max_length,
-                              generation=layers[0]._generation+1)
-            new_layer.push(obj)
-            self._layers.insert(0, new_layer)
-        self._layers, pruned = layers[:max], layers[max:]
-        if pruner is not None:
-            for layer in pruned:
-                pruner(layer._generation, layer._stack)
+        if retention is not None:
+            max = retention.retained(self, min(max, count), rolled_over)
+        if count > max:
+            if pruner is not None:
+                for at in range(count - 1, max - 1, -1):
+                    layer = self._getLayer(at)
+                    pruner(layer._generation, layer._stack)
+            del layers[max:]
+            info = self._layer_info
+            if info:
+                oldest = self._generationAt(max - 1)
+                for generation in list(info):
+                    if generation < oldest:
+                        del info[generation]
+            self._p_changed = True
+
+    def newer_slices(self, latest_gen=-1, latest_index=-1):
+        """ See IAppendStack.
+        """
+        pos = self._layerPosition(latest_gen)
+        for at in range(min(pos + 1, len(self._layers))):
+            layer = self._getLayer(at)
+            generation = layer._generation
+            if generation < latest_gen:
+                break
+            first = 0
+            if generation == latest_gen:
+                first = max(latest_index + 1, 0)
+            stack = layer._stack
+            if first >= len(stack):
+                continue
+            if at > 0 and isinstance(stack, array):
+                # Full layers are no longer appended to:  share their
+                # buffer.  The head layer's slice is copied, as an exported
+                # buffer would prevent further pushes.
+                yield generation, first, memoryview(stack)[first:]
+            else:
+                yield generation, first, stack[first:]
 
     def __getstate__(self):
-        layers = [(x._generation, x._stack) for x in self._layers]
-        return (self._max_layers, self._max_length, layers)
+        typecode = self._typecode
+        layers = []
+        for layer in self._layers:
+            if type(layer) is not tuple: # else, still as unpickled
+                items = layer._stack
+                if typecode is not None:
+                    items = _toBytes(items)
+                layer = (layer._generation, items)
+            layers.append(layer)
+        return self._stateWith(layers)
+
+    def _stateWith(self, layers):
+        # The typecode and layer info are saved only if set.
+        state = (self._max_layers, self._max_length, layers)
+        if self._typecode is not None or self._layer_info:
+            state = state + (self._typecode,)
+        if self._layer_info:
+            state = state + (self._layer_info,)
+        return state
 
     def __setstate__(self, state):
-        self._max_layers, self._max_length, layer_data = state
-        self._layers = []
-        for generation, items in layer_data:
-            layer = _Layer(self._max_length, generation)
-            for item in items:
-                layer.push(item)
-            self._layers.append(layer)
+        self._max_layers, self._max_length, layer_data = state[:3]
+        self._typecode = _stateTypecode(state)
+        self._layer_info = _stateLayerInfo(state)
+        # Defer building layer objects until each is used:  see _getLayer.
+        self._layers = [tuple(x) for x in layer_data]
 
     #
     # ZODB Conflict resolution
@@ -138,54 +615,284 @@ class AppendStack(Persistent):
     # committed state to create a merged state.
     # Unresolvable errors include:
     # - any difference between O <-> C <-> N on the non-layers attributes.
-    # - either C or N has its oldest layer in a later generation than O's
-    #   newest layer.
+    # - N has rolled past O's newest layer, O', such that items which N
+    #   pushed can no longer be identified:  N has pruned O' (or any later
+    #   layer) while O' still had room.
     # Compute the O -> N diff via the following:
     # - Find the layer, N' in N whose generation matches the newest generation
     #   in O, O'.
     # - Compute the new items in N` by slicing it using the len(O').
     # - That slice, plus any newer layers in N, form the set to be pushed
     #   onto C.
-    #   
+    # - If N has pruned O', it must have been full:  N's new items are then
+    #   exactly its layers (the oldest of which must follow O').
+    # C may have rolled past O freely:  N's new items are pushed onto C's
+    # newest layer whatever its generation.  The merged state may then hold
+    # more than 'max_layers' layers.
+    # The layer info kept for `Retention` is only a cache:  the merged state
+    # drops it.
+    #
     def _p_resolveConflict(self, old, committed, new):
-        o_m_layers, o_m_length, o_layers = old
-        c_m_layers, c_m_length, c_layers = committed
-        m_layers = [x[:] for x in c_layers]
-        n_m_layers, n_m_length, n_layers = new
+        typecode = _stateTypecode(old)
+        if not typecode == _stateTypecode(committed) == _stateTypecode(new):
+            raise ConflictError('Conflicting typecode')
+
+        o_m_layers, o_m_length, o_layers = old[:3]
+        c_m_layers, c_m_length, c_layers = committed[:3]
+        n_m_layers, n_m_length, n_layers = new[:3]
         
-        if not o_m_layers == n_m_layers == n_m_layers:
+        if not o_m_layers == c_m_layers == n_m_layers:
             raise ConflictError('Conflicting max layers')
 
         if not o_m_length == c_m_length == n_m_length:
             raise ConflictError('Conflicting max length')
 
+        if typecode is not None:
+            o_layers = _decodeLayers(typecode, o_layers[:1])
+            c_layers = _decodeLayers(typecode, c_layers)
+            n_layers = _decodeLayers(typecode, n_layers)
+
         o_latest_gen = o_layers[0][0]
         o_latest_items = o_layers[0][1]
-        c_earliest_gen = c_layers[-1][0]
         n_earliest_gen = n_layers[-1][0]
 
-        if o_latest_gen < c_earliest_gen:
-            raise ConflictError('Committed obsoletes old')
-
         if o_latest_gen < n_earliest_gen:
-            raise ConflictError('New obsoletes old')
+            if (n_earliest_gen > o_latest_gen + 1 or
+                    len(o_latest_items) < o_m_length):
+                raise ConflictError('New obsoletes old')
 
-        new_objects = []
-        for n_generation, n_items in n_layers:
+        # Collect the new objects oldest-first, in a single pass.
+        if typecode is None:
+            new_objects = []
+        else:
+            new_objects = array(_arrayTypecode(typecode))
+        for n_generation, n_items in reversed(n_layers):
             if n_generation > o_latest_gen:
-                new_objects[:0] = n_items
+                new_objects.extend(n_items)
             elif n_generation == o_latest_gen:
-                new_objects[:0] = n_items[len(o_latest_items):]
-            else:
-                break
+                new_objects.extend(n_items[len(o_latest_items):])
+
+        m_layers = _pushOnto(c_layers, new_objects, c_m_length)
+
+        # We cannot call a pruner here:  drop only those layers which new
+        # has already handed to its pruner (committed cannot have added to
+        # them, as they were full in old).  Any layers left beyond
+        # 'max_layers' are kept, and pruned by the next push which adds a
+        # layer.
+        m_layers = [x for x in m_layers if x[0] >= n_earliest_gen]
+
+        if typecode is not None:
+            m_layers = [(gen, _toBytes(items)) for gen, items in m_layers]
+            return c_m_layers, c_m_length, m_layers, typecode
+        return c_m_layers, c_m_length, m_layers
+
+
+def _stateTypecode(state):
+    # Typed stacks add their typecode to the pickled state.
+    if len(state) > 3:
+        return state[3]
+    return None
+
 
-        while new_objects:
-            to_push, new_objects = new_objects[0], new_objects[1:]
-            if len(m_layers[0][1]) == c_m_length:
-                m_layers.insert(0, (m_layers[0][0]+1, []))
-            m_layers[0][1].append(to_push)
+def _stateLayerInfo(state):
+    # Stacks pruned with a `Retention` add their layer info after that.
+    if len(state) > 4:
+        return state[4]
+    return None
 
-        return c_m_layers, c_m_length, m_layers[:c_m_layers]
+
+def _toBytes(items):
+    try:
+        return items.tobytes()
+    except AttributeError: # Python 2
+        return items.tostring()
+
+
+# Python < 3.3 lacks the 64-bit 'q' / 'Q' typecodes:  use 'l' / 'L'
+# instead where they are the same size (the pickled bytes are then the
+# same).  We keep the typecode as passed in our state.
+_TYPECODES = {}
+try:
+    array('q')
+except ValueError: # Python < 3.3
+    if array('l').itemsize == 8:
+        _TYPECODES = {'q': 'l', 'Q': 'L'}
+
+
+def _arrayTypecode(typecode):
+    return _TYPECODES.get(typecode, typecode)
+
+
+def _fromBytes(typecode, data):
+    items = array(_arrayTypecode(typecode))
+    try:
+        items.frombytes(data)
+    except AttributeError: # Python 2
+        items.fromstring(data)
+    return items
+
+
+def _decodeLayers(typecode, layers):
+    return [(gen, _fromBytes(typecode, data)) for gen, data in layers]
+
+
+def _pushOnto(layers, objs, max_length):
+    """ Return layer state, most-recent first, with `objs` pushed onto it.
+
+    - `layers` is a list of (generation, items) pairs, as in the pickled
+      state of an `AppendStack`.
+
+    - Only the head layer is copied (if it has room);  other layers are
+      shared with `layers`.
+    """
+    merged = list(layers)
+    generation, items = merged[0]
+    pos = max(max_length - len(items), 0)
+    if pos and objs:
+        merged[0] = (generation, items + objs[:pos])
+    added = []
+    while pos < len(objs):
+        generation = generation + 1
+        added.append((generation, objs[pos:pos + max_length]))
+        pos = pos + max_length
+    added.reverse()
+    merged[:0] = added
+    return merged
+
+
+class _BucketLayer(Persistent, _LayerBase):
+    """ Layer saved as a separate persistent sub-object.
+
+    - Used by `BucketedAppendStack`, so that appending an item writes only
+      the head layer's record, rather than the items of every layer.
+
+    - Resolving conflicting appends may leave the layer holding more than
+      its maximum length.
+    """
+    def push(self, obj):
+        self._stack.append(obj)
+        self._p_changed = True
+
+    #
+    # ZODB Conflict resolution
+    #
+    # Layers only ever grow:  append the items added in new onto committed.
+    #
+    def _p_resolveConflict(self, old, committed, new):
+        for name in ('_generation', '_max_length'):
+            if not old[name] == committed[name] == new[name]:
+                raise ConflictError('Conflicting %s' % name)
+        merged = dict(committed)
+        merged['_stack'] = (committed['_stack'] +
+                            new['_stack'][len(old['_stack']):])
+        return merged
+
+
+@implementer(IAppendStack)
+class BucketedAppendStack(AppendStack):
+    """ Append-only stack whose layers are separate persistent objects.
+
+    - Pushing an item which fits in the head layer writes only that layer's
+      record;  our own (small) record is written only when a layer is added.
+
+    - Concurrent appends to the head layer are resolved by the layer;
+      concurrent additions of a new layer are not resolvable.
+    """
+    _layer_factory = _BucketLayer
+
+    def _layerChanged(self, layer):
+        layer._p_changed = True
+
+    def _layerPosition(self, generation):
+        # Our generations are always contiguous:  avoid loading the oldest
+        # layer just to check its generation.
+        layers = self._layers
+        pos = layers[0]._generation - generation
+        if pos < 0:
+            return -1
+        return min(pos, len(layers))
+
+    def _generationAt(self, at):
+        # Avoid loading the layer, as for '_layerPosition'.
+        return self._layers[0]._generation - at
+
+    def __getstate__(self):
+        return self._stateWith(list(self._layers))
+
+    def __setstate__(self, state):
+        self._max_layers, self._max_length, layers = state[:3]
+        self._typecode = _stateTypecode(state)
+        self._layer_info = _stateLayerInfo(state)
+        self._layers = list(layers)
+
+    def _p_resolveConflict(self, old, committed, new):
+        raise ConflictError('Conflicting layer rollover')
+
+
+def merge_newer(stacks, cursors=None, limit=None, key=None):
+    """ Yield the most recent items across many stacks, most-recent first.
+
+    - If passed, `cursors` holds a (generation, index) key, or None, for
+      each stack:  yield only that stack's items newer than its cursor (as
+      `newer` does).
+
+    - Order items by `key(obj)` if passed (e.g., a timestamp), else by their
+      (generation, index) keys.  Each stack's items must already be in
+      descending order of that key.
+
+    - Yield (position, generation, index, object) tuples, where `position`
+      is the index of the item's stack in `stacks`.  Items with equal keys
+      are yielded in order of `position`.
+
+    - Stop after `limit` items.  Each stack is read lazily, at most one
+      item ahead of those yielded.
+    """
+    if limit is not None and limit <= 0:
+        return
+    stacks = list(stacks)
+    _prefetch(stacks)
+    heap = []
+    for position, stack in enumerate(stacks):
+        cursor = None if cursors is None else cursors[position]
+        if cursor is None:
+            items = iter(stack)
+        else:
+            items = stack.newer(cursor[0], cursor[1])
+        _pushNewest(heap, position, items, key)
+    count = 0
+    while heap:
+        _, position, generation, index, obj, items = heappop(heap)
+        yield position, generation, index, obj
+        count += 1
+        if count == limit:
+            return
+        _pushNewest(heap, position, items, key)
+
+
+class _Descending(object):
+    # Invert the ordering of a sort key, so that 'heapq' pops the largest.
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def _pushNewest(heap, position, items, key):
+    # Push the next of 'items' onto 'heap', if any remain.
+    for generation, index, obj in items:
+        if key is None:
+            order = (generation, index)
+        else:
+            order = key(obj)
+        heappush(heap, (_Descending(order), position,
+                        generation, index, obj, items))
+        return
 
 
 class _ArchiveLayer(Persistent, _LayerBase):
@@ -198,33 +905,408 @@ class _ArchiveLayer(Persistent, _LayerBase):
     _next = None
 
     @classmethod
-    def fromLayer(klass, layer):
+    def fromLayer(klass, layer, adopt=False):
+        """ Return an archive layer holding the items of `layer`.
+
+        - If `adopt` is true, take over `layer`'s storage rather than copying
+          it:  `layer` must not be modified afterwards.
+        """
+        if adopt:
+            return klass(layer._max_length, layer._generation, layer._stack)
         copy = klass(layer._max_length, layer._generation)
         copy._stack[:] = layer._stack
         return copy
 
+    # Each node in an archive's linked list is either an `_ArchiveLayer`
+    # or an `_ArchiveSegment`, which share these methods.
+    def _archivedGenerations(self):
+        return [self._generation]
+
+    def _archivedLayer(self, generation):
+        if generation == self._generation:
+            return self
+        return None
+
+    def _archivedLayers(self, low=None, high=None, reverse=False):
+        generation = self._generation
+        if (low is None or low <= generation) and (
+                high is None or generation <= high):
+            yield self
+
+
+class _ArchiveSegment(Persistent):
+    """ Run of consecutive archived layers, saved as one persistent object.
+
+    - Created by `Archive.compact`, in place of the layers it holds.
+
+    - Like an `_ArchiveLayer`, a segment is immutable except for `_next`,
+      and `_generation` is its most recent generation.
+    """
+    _next = None
+
+    def __init__(self, layers):
+        # 'layers' are oldest-first;  we adopt their items.
+        self._max_length = layers[0]._max_length
+        self._generations = [x._generation for x in layers]
+        self._stacks = [x._stack for x in layers]
+        self._generation = self._generations[-1]
+
+    def _archivedGenerations(self):
+        return self._generations
+
+    def _archivedLayer(self, generation):
+        generations = self._generations
+        at = bisect_left(generations, generation)
+        if at < len(generations) and generations[at] == generation:
+            return _Layer(self._max_length, generation, self._stacks[at])
+        return None
+
+    def _archivedLayers(self, low=None, high=None, reverse=False):
+        """ Yield the layers with generations in [`low`, `high`].
+
+        - Either bound may be None.  Layers are transient views of the
+          segment's items.
+        """
+        generations = self._generations
+        lo = 0 if low is None else bisect_left(generations, low)
+        hi = len(generations)
+        if high is not None:
+            hi = bisect_right(generations, high)
+        if reverse:
+            positions = _countDown(hi - 1, lo - 1)
+        else:
+            positions = _countUp(lo, hi)
+        for at in positions:
+            yield _Layer(self._max_length, generations[at], self._stacks[at])
+
+
+class _ArchiveIndexPage(Persistent):
+    """ Sorted run of archived generations, with their layers.
+
+    - Pages are kept in order by an indexed `Archive`:  each page holds
+      generations newer than any in the page before it.
+    """
+    def __init__(self):
+        self._generations = []
+        self._layers = []
+
+    def add(self, generation, layer):
+        self._generations.append(generation)
+        self._layers.append(layer)
+        self._p_changed = True
+
+    def find(self, generation):
+        """ Return the layer for `generation`, or None.
+        """
+        generations = self._generations
+        at = bisect_left(generations, generation)
+        if at < len(generations) and generations[at] == generation:
+            return self._layers[at]
+        return None
+
+    def replace(self, generation, layer):
+        """ Index `generation` to `layer` in place of its current layer.
+        """
+        at = bisect_left(self._generations, generation)
+        self._layers[at] = layer
+        self._p_changed = True
+
+    def layersWithin(self, low, high, reverse=False):
+        """ Yield layers whose generations are in [`low`, `high`].
+
+        - Either bound may be None.
+
+        - A segment is yielded once for each of its generations in range.
+        """
+        generations = self._generations
+        lo = 0 if low is None else bisect_left(generations, low)
+        hi = len(generations)
+        if high is not None:
+            hi = bisect_right(generations, high)
+        if reverse:
+            positions = _countDown(hi - 1, lo - 1)
+        else:
+            positions = _countUp(lo, hi)
+        for at in positions:
+            yield self._layers[at]
+
+    #
+    # ZODB Conflict resolution
+    #
+    # Pages are mutated by adding generations (`Archive.addLayer`), or by
+    # replacing the layers of existing ones (`Archive.compact`).
+    # - Keep each replacement made by either side;  both replacing the same
+    #   generation with different layers conflicts.
+    # - Mirror `Archive` for added generations:  if both sides added the same
+    #   generations, they added equivalent layers, so keep the committed
+    #   versions.  Otherwise, keep the generations of whichever side added.
+    #
+    def _p_resolveConflict(self, old, committed, new):
+        o_gens = old['_generations']
+        c_gens = committed['_generations']
+        n_gens = new['_generations']
+        size = len(o_gens)
+        if c_gens[:size] != o_gens or n_gens[:size] != o_gens:
+            raise ConflictError('Conflicting generations')
+        c_added, n_added = c_gens[size:], n_gens[size:]
+        if c_added and n_added and c_added != n_added:
+            raise ConflictError('Conflicting generations')
+        o_layers = _refOids(old['_layers'])
+        c_layers = _refOids(committed['_layers'][:size])
+        n_layers = _refOids(new['_layers'][:size])
+        layers = list(committed['_layers'][:size])
+        for at, (o_oid, c_oid, n_oid) in enumerate(
+                zip(o_layers, c_layers, n_layers)):
+            if n_oid != o_oid:
+                if c_oid != o_oid and c_oid != n_oid:
+                    raise ConflictError('Conflicting replacements')
+                layers[at] = new['_layers'][at]
+        if n_added and not c_added:
+            added = new
+        else:
+            added = committed
+        resolved = dict(committed)
+        resolved['_generations'] = list(added['_generations'])
+        resolved['_layers'] = layers + list(added['_layers'][size:])
+        return resolved
+
 
 class Archive(Persistent):
     """ Manage layers discarded from an AppendStack as a persistent linked list.
+
+    - If created with `indexed=True` (or after calling `buildIndex`), also
+      keep an index from generation to layer, so that seeks and range scans
+      load only the layers they need.  The index is a BTree of pages, keyed
+      by each page's first generation:  adding a page writes neither our
+      own record nor the other pages.
+
+    - `compact` packs runs of layers into segments:  each node in the list
+      is then either a layer or a segment of consecutive layers.
     """
     _head = None
     _generation = -1
+    _index = None           # first generation -> _ArchiveIndexPage
+    _index_page_size = 512
+
+    # Number of layers to prefetch ahead of iteration, for indexed archives.
+    # Unindexed archives can only prefetch the next layer in the list.
+    prefetch_depth = 16
+
+    def __init__(self, indexed=False):
+        if indexed:
+            self._index = LOBTree()
+
+    def buildIndex(self):
+        """ Index the layers of an existing, unindexed archive.
+
+        - Walks the whole linked list once.
+        """
+        layers = []
+        current = self._head
+        while current is not None:
+            layers.append(current)
+            current = current._next
+        self._index = LOBTree()
+        for layer in reversed(layers):
+            self._indexLayer(layer)
+
+    def _indexLayer(self, layer):
+        index = self._index
+        page = None
+        if index:
+            page = index[index.maxKey()]
+        for generation in layer._archivedGenerations():
+            if (page is None or
+                    len(page._generations) >= self._index_page_size):
+                page = index[generation] = _ArchiveIndexPage()
+            page.add(generation, layer)
+
+    def _indexPage(self, generation):
+        # Return the index page which would hold `generation`, or None.
+        try:
+            start = self._index.maxKey(generation)
+        except ValueError: # older than any indexed generation
+            return None
+        return self._index[start]
 
     def __iter__(self):
+        return self.iter_range(reverse=True)
+
+    def __getitem__(self, key):
+        """ Return the item archived at the (generation, index) `key`.
+
+        - Raise KeyError if not found.
+        """
+        generation, index = key
+        found = _layerItem(self._findLayer(generation), generation, index)
+        if found is _marker:
+            raise KeyError(key)
+        return found
+
+    def get(self, key, default=None):
+        """ Return the item archived at `key`, or `default` if not found.
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def _findLayer(self, generation):
+        # Return the layer for `generation`, or None.
+        if self._index is not None:
+            page = self._indexPage(generation)
+            if page is None:
+                return None
+            node = page.find(generation)
+            if node is None:
+                return None
+            return node._archivedLayer(generation)
+        # Each node's generation is the most recent it holds.
+        node = self._head
+        while node is not None and node._generation >= generation:
+            layer = node._archivedLayer(generation)
+            if layer is not None:
+                return layer
+            node = node._next
+        return None
+
+    def iter_range(self, start=None, stop=None, reverse=False,
+                   prefetch=None):
+        """ Yield (generation, index, object) tuples within a key range.
+
+        - `start` and `stop` are (generation, index) keys;  `start` is
+          inclusive, `stop` exclusive, and either may be None.
+
+        - Yield oldest-first, or most-recent first if `reverse` is true.
+
+        - `prefetch` overrides `prefetch_depth`, the number of layers
+          requested from the database ahead of iteration.
+        """
+        if prefetch is None:
+            prefetch = self.prefetch_depth
+        if self._index is not None:
+            nodes = _prefetching(
+                self._indexedLayersWithin(start, stop, reverse), prefetch)
+        elif reverse:
+            nodes = self._layersWithin(start, stop)
+        else:
+            # The list is linked newest-first:  collect the (ghost) nodes
+            # in range, rather than their items, to walk it backwards.
+            nodes = list(self._layersWithin(start, stop))
+            nodes.reverse()
+        low = None if start is None else start[0]
+        high = None if stop is None else stop[0]
+        for node in nodes:
+            for layer in node._archivedLayers(low, high, reverse):
+                generation = layer._generation
+                for index, item in _layerRange(layer, start, stop, reverse):
+                    yield generation, index, item
+
+    def _indexedLayersWithin(self, start, stop, reverse):
+        # Yield nodes overlapping the generations in [start, stop], using
+        # the index, without walking the linked list.
+        index = self._index
+        low = high = first = None
+        if start is not None:
+            low = first = start[0]
+            try:
+                first = index.maxKey(low) # the page holding 'low'
+            except ValueError:
+                first = None
+        if stop is not None:
+            high = stop[0]
+        pages = list(index.values(first, high))
+        if reverse:
+            pages.reverse()
+        previous = None
+        for page in pages:
+            for node in page.layersWithin(low, high, reverse):
+                if node is not previous: # a segment spans generations
+                    yield node
+                    previous = node
+
+    def _layersWithin(self, start, stop):
+        # Yield nodes which may overlap the generations in [start, stop],
+        # most recent first.
         current = self._head
         while current is not None:
-            for index, item in current:
-                yield current._generation, index, item
+            # A node's generation is the most recent it holds.
+            if start is not None and current._generation < start[0]:
+                break
+            # The next node's reference is only known once 'current' has
+            # been loaded:  request it while 'current' is consumed.
+            _prefetch([current._next])
+            yield current
             current = current._next
 
     def addLayer(self, generation, items):
+        copy = _ArchiveLayer(generation=generation)
+        copy._stack[:] = items
+        self._addLayer(copy)
+
+    def adoptLayer(self, generation, items):
+        """ Add a layer whose storage is `items` itself, without copying.
+
+        - The caller hands over ownership of `items`, and must not modify
+          it afterwards.  An `AppendStack` discards the layers it prunes,
+          so `adoptLayer` may be used as its pruner.
+        """
+        self._addLayer(_ArchiveLayer(generation=generation, items=items))
+
+    def _addLayer(self, layer):
+        generation = layer._generation
         if generation <= self._generation:
             raise ValueError(
                     "Cannot add older layers to an already-populated archive")
-        copy = _ArchiveLayer(generation=generation)
-        copy._stack[:] = items
-        self._head, copy._next = copy, self._head
+        self._head, layer._next = layer, self._head
         self._generation = generation
+        if self._index is not None:
+            self._indexLayer(layer)
+
+    def compact(self, segment_size=100):
+        """ Pack runs of `segment_size` consecutive layers into segments.
+
+        - Each segment is a single persistent object, holding the items of
+          the layers it replaces (which are left for the storage to pack
+          away).  Items keep their (generation, index) keys.
+
+        - Only complete runs of uncompacted layers are packed;  the most
+          recent layer is never packed, so that compaction doesn't write
+          the archive's own record, and may run alongside `addLayer`:  for
+          an indexed archive, the index pages merge compaction's
+          replacements with concurrently added generations.
+
+        - Walks the whole linked list once.  Return the number of segments
+          created.
+        """
+        nodes = []
+        current = self._head
+        while current is not None:
+            nodes.append(current)
+            current = current._next
+        created = 0
+        run = []
+        # Walk oldest-first, so that each segment's older neighbor is
+        # already final when the segment is linked to it.
+        for at in range(len(nodes) - 1, 0, -1):
+            node = nodes[at]
+            if not isinstance(node, _ArchiveLayer):
+                run = []
+                continue
+            run.append(node)
+            if len(run) == segment_size:
+                segment = _ArchiveSegment(run)
+                segment._next = run[0]._next
+                nodes[at - 1]._next = segment
+                if self._index is not None:
+                    self._reindex(segment)
+                created += 1
+                run = []
+        return created
+
+    def _reindex(self, segment):
+        for generation in segment._archivedGenerations():
+            self._indexPage(generation).replace(generation, segment)
 
     #
     # ZODB Conflict resolution
@@ -238,22 +1320,170 @@ class Archive(Persistent):
     # that the source layers are coming from the same AppendStack, in which
     # case they will be identical.
     #
+    # For an indexed archive, the index pages follow the same rule.  The
+    # BTree of pages cannot resolve both sides opening a page for the same
+    # generation:  that rare case conflicts.
+    #
     def _p_resolveConflict(self, old, committed, new):
         if committed['_generation'] == new['_generation']:
             return committed
         raise ConflictError('Conflicting generations')
 
 
+class ArchiveBuffer(Persistent):
+    """ Hold layers pruned from an AppendStack until flushed to an Archive.
+
+    - Pass `addLayer` as the stack's pruner:  pruning then saves the
+      layer as a new archive layer object, and appends a reference to it
+      to a pending `ChunkedAccumulator`, rather than linking it into the
+      archive within the pushing transaction.  Each prune thus writes the
+      new layer and one bounded chunk, however many layers are pending.
+
+    - `flush` links the pending layers into the archive, e.g. from a
+      separate maintenance transaction.  If `flush_after` is passed,
+      `addLayer` also flushes once that many layers are pending.
+    """
+    def __init__(self, archive, flush_after=None):
+        self._archive = archive
+        self._flush_after = flush_after
+        self._pending = ChunkedAccumulator()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __iter__(self):
+        """ Yield pending (generation, items) pairs, most-recent first.
+        """
+        for layer in sorted(self._pending, key=_generationOf, reverse=True):
+            yield layer._generation, layer._stack
+
+    def addLayer(self, generation, items):
+        # Adopt 'items':  the stack discards the layers it prunes.
+        self._pending.append(_ArchiveLayer(generation=generation,
+                                           items=items))
+        if (self._flush_after is not None and
+                len(self._pending) >= self._flush_after):
+            self.flush()
+
+    def flush(self):
+        """ Add the pending layers to the archive, oldest first.
+
+        - Skip layers no newer than the archive's most recent layer:  they
+          were flushed by a concurrent transaction.
+
+        - Return the number of layers added.
+        """
+        archive = self._archive
+        added = 0
+        for layer in sorted(self._pending.consume(), key=_generationOf):
+            if layer._generation > archive._generation:
+                archive._addLayer(layer)
+                added += 1
+        return added
+
+
+def _generationOf(layer):
+    return layer._generation
+
+
+class History(object):
+    """ Read-only view spanning an AppendStack and the Archive it prunes to.
+
+    - Items in the stack's retained generations are read from the stack;
+      older items from the archive, whose layers are loaded only as needed.
+
+    - Keys and results are as for `AppendStack`.
+    """
+    def __init__(self, stack, archive):
+        self.stack = stack
+        self.archive = archive
+
+    def _boundary(self):
+        # Key of the oldest item which may be retained by the stack:  older
+        # keys belong to the archive.
+        stack = self.stack
+        return (stack._generationAt(len(stack._layers) - 1), 0)
+
+    def __iter__(self):
+        """ Yield (generation, index, object) tuples, most-recent first.
+        """
+        return self.iter_range(reverse=True)
+
+    def __getitem__(self, key):
+        """ Return the item at the (generation, index) `key`.
+
+        - Raise KeyError if not found.
+        """
+        if tuple(key) >= self._boundary():
+            return self.stack[key]
+        return self.archive[key]
+
+    def get(self, key, default=None):
+        """ Return the item at `key`, or `default` if not found.
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def newer(self, latest_gen, latest_index, limit=None):
+        """ Yield items newer than the given key, most-recent first.
+
+        - Stop after `limit` items, if passed.
+        """
+        if limit is not None and limit <= 0:
+            return
+        for found in islice(
+                self.iter_range(start=(latest_gen, latest_index + 1),
+                                reverse=True), limit):
+            yield found
+
+    def iter_range(self, start=None, stop=None, reverse=False):
+        """ Yield (generation, index, object) tuples within a key range.
+
+        - `start` and `stop` are (generation, index) keys;  `start` is
+          inclusive, `stop` exclusive, and either may be None.
+
+        - Yield oldest-first, or most-recent first if `reverse` is true.
+
+        - Only consult the archive if the range begins before the stack's
+          oldest retained generation.
+        """
+        boundary = self._boundary()
+        tiers = []
+        if start is None or tuple(start) < boundary:
+            if stop is None or tuple(stop) > boundary:
+                archived = boundary
+            else:
+                archived = stop
+            tiers.append((self.archive, start, archived))
+        if stop is None or tuple(stop) > boundary:
+            if start is None or tuple(start) < boundary:
+                live = boundary
+            else:
+                live = start
+            tiers.append((self.stack, live, stop))
+        if reverse:
+            tiers.reverse()
+        for tier, low, high in tiers:
+            for found in tier.iter_range(low, high, reverse):
+                yield found
+
+
 class Accumulator(Persistent):
 
-    __slots__ = ('_list',)
+    __slots__ = ('_list', '_consumed')
 
     def __init__(self, value=()):
         self._list = list(value)
+        self._consumed = 0
 
     def __iter__(self):
         return iter(self._list)
 
+    def __len__(self):
+        return len(self._list)
+
     def append(self, v):
         self._list.append(v)
         self._p_changed = 1
@@ -262,15 +1492,46 @@ class Accumulator(Persistent):
         self._list.extend(v)
         self._p_changed = 1
 
-    def consume(self):
-        result, self._list = self._list[:], []
+    def consume(self, max_items=None):
+        """ Remove and return the oldest items, up to `max_items` of them.
+
+        - If `max_items` is None, remove and return all items.
+        """
+        if max_items is None or max_items >= len(self._list):
+            result, self._list = self._list[:], []
+        else:
+            max_items = max(max_items, 0)
+            result = self._list[:max_items]
+            del self._list[:max_items] # rather than copying the remainder
+            self._p_changed = True
+        self._consumed += len(result)
         return result
 
+    def drain(self, batch_size=100):
+        """ Consume and yield lists of at most `batch_size` items.
+
+        - Stop when no items remain.
+
+        - Each batch is consumed as it is yielded:  callers wanting bounded
+          transactions should commit after processing each batch.
+
+        - Our items are saved in a single record, so each commit re-pickles
+          all the items remaining:  use `ChunkedAccumulator` to drain large
+          backlogs.
+
+        - Raise ValueError if `batch_size` is less than one.
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be at least 1')
+        return _drain(self, batch_size)
+
     def __getstate__(self):
-        return self._list
+        return (self._consumed, self._list)
 
     def __setstate__(self, value):
-        self._list = list(value)
+        if isinstance(value, list): # BBB: state was just the list
+            value = (0, value)
+        self._consumed, self._list = value[0], list(value[1])
 
     #
     # ZODB Conflict resolution
@@ -281,19 +1542,269 @@ class Accumulator(Persistent):
     # the suffices from both.  Otherwise, contcatenate the new suffix to
     # committed.
     #
+    # Our state carries '_consumed', the count of items ever consumed:  the
+    # first item in the list has that sequence number.  Comparing counts
+    # tells us in O(1) how much of the old list each side consumed, and
+    # where its appended suffix starts, without comparing items.
+    # Partial consumes (`consume(max_items)`) resolve the same way:  keep
+    # the old items which neither side consumed, followed by both suffixes.
+    #
+    # Items appended by committed and by new are numbered independently
+    # past the end of old, and either side may have consumed some of its
+    # own appended items.  The merged state keeps committed's numbering
+    # (later transactions may have read committed), with new's suffix
+    # following committed's:  the count of consumed items only includes
+    # new's consumption of old items.
+    #
     def _p_resolveConflict(self, old, committed, new):
-        if committed[:len(old)] == old:
-            c_clear = False
-            c_sfx = committed[len(old):]
-        else:
-            c_clear = True
-            c_sfx = committed[:]
-        if new[:len(old)] == old:
-            n_clear = False
-            n_sfx = new[len(old):]
+        return _resolveConsumed(old, committed, new)
+
+
+def _drain(accumulator, batch_size):
+    while True:
+        batch = accumulator.consume(batch_size)
+        if not batch:
+            break
+        yield batch
+
+
+def _resolveConsumed(old, committed, new):
+    # See Accumulator._p_resolveConflict.
+    if isinstance(committed, list) or isinstance(new, list):
+        # BBB:  written by a version which pickled only the list.
+        return _resolveAppends(_accumulated(old),
+                               _accumulated(committed),
+                               _accumulated(new))
+    if isinstance(old, list):
+        old = (0, old)
+    o_consumed, o_list = old
+    c_consumed, c_list = committed
+    n_consumed, n_list = new
+    o_end = o_consumed + len(o_list)
+    c_sfx = _appendedSuffix(o_consumed, o_end, c_consumed, c_list)
+    n_sfx = _appendedSuffix(o_consumed, o_end, n_consumed, n_list)
+    either = max(c_consumed, n_consumed)
+    kept = o_list[either - o_consumed:] if either < o_end else []
+    consumed = max(c_consumed, min(n_consumed, o_end))
+    return (consumed, kept + c_sfx + n_sfx)
+
+
+def _appendedSuffix(o_consumed, o_end, consumed, items):
+    # Return the items one side of a conflict appended (and still holds),
+    # given the old state's consumed count and end, and the side's state.
+    if consumed < o_consumed:
+        raise ConflictError('Consumed count went backwards')
+    held = max(o_end - consumed, 0) # old items the side hasn't consumed
+    if len(items) < held:
+        raise ConflictError('Old items dropped without consuming')
+    return items[held:]
+
+
+def _accumulated(state):
+    # Return the list of items from either form of Accumulator state.
+    if isinstance(state, list):
+        return state
+    return state[1]
+
+
+def _resolveAppends(old, committed, new):
+    # See Accumulator._p_resolveConflict.
+    if committed[:len(old)] == old:
+        c_clear = False
+        c_sfx = committed[len(old):]
+    else:
+        c_clear = True
+        c_sfx = committed[:]
+    if new[:len(old)] == old:
+        n_clear = False
+        n_sfx = new[len(old):]
+    else:
+        n_clear = True
+        n_sfx = new[:]
+    if c_clear or n_clear:
+        return c_sfx + n_sfx
+    return committed + n_sfx
+
+
+class _AccumulatorChunk(Persistent):
+    """ Bounded run of the items held by a `ChunkedAccumulator`.
+
+    - Like `Accumulator`, a chunk counts the items consumed from it.
+
+    - A chunk dropped from its accumulator by `consume` is "retired":  its
+      state becomes None.
+    """
+    __slots__ = ('_list', '_consumed')
+
+    def __init__(self, value=()):
+        self._list = list(value)
+        self._consumed = 0
+
+    def __getstate__(self):
+        if self._list is None:
+            return None
+        return (self._consumed, self._list)
+
+    def __setstate__(self, value):
+        if value is None:
+            self._consumed, self._list = 0, None
+        elif isinstance(value, list): # BBB: state was just the list
+            self._consumed, self._list = 0, value
         else:
-            n_clear = True
-            n_sfx = new[:]
-        if c_clear or n_clear:
-            return c_sfx + n_sfx
-        return committed + n_sfx
+            self._consumed, self._list = value[0], list(value[1])
+
+    #
+    # ZODB Conflict resolution
+    #
+    # Appends and consumes resolve as for Accumulator.  A retired chunk is no
+    # longer reachable from its accumulator, so items appended to it
+    # concurrently would be lost:  refuse to resolve in that case.  A
+    # retirement wins over a concurrent consume, so that the chunk stays
+    # retired, and later appends to it conflict.
+    #
+    def _p_resolveConflict(self, old, committed, new):
+        if committed is None or new is None:
+            other = new if committed is None else committed
+            if other is None:
+                return None
+            if isinstance(old, tuple) and isinstance(other, tuple):
+                o_consumed, o_list = old
+                appended = _appendedSuffix(o_consumed,
+                                           o_consumed + len(o_list),
+                                           other[0], other[1])
+            else: # BBB: list-only states
+                appended = _accumulated(other)
+            if appended:
+                raise ConflictError('Append to retired chunk')
+            return None
+        return _resolveConsumed(old, committed, new)
+
+
+def _refOids(refs):
+    # 'PersistentReference' instances compare only if equal:  use oids.
+    return [x.oid for x in refs]
+
+
+class ChunkedAccumulator(Persistent):
+    """ Accumulator holding its items in bounded persistent chunks.
+
+    - Appending to the last ("tail") chunk writes only that chunk's record;
+      our own record is written only when a new chunk is added, or when
+      consuming.
+
+    - `consume` retires the chunks it empties, other than the tail chunk,
+      which it clears in place, so that any concurrent append to a retired
+      chunk conflicts with it.  Consuming part of our items writes only the
+      chunks it touches, plus our own record.
+
+    - Items extended by concurrent writers keep their order relative to
+      each other, but may be interleaved across chunks.
+    """
+    def __init__(self, value=(), chunk_size=100):
+        self._chunk_size = chunk_size
+        self._chunks = [_AccumulatorChunk()]
+        self.extend(value)
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            for item in chunk._list:
+                yield item
+
+    def __len__(self):
+        return sum([len(chunk._list) for chunk in self._chunks])
+
+    def append(self, v):
+        self.extend((v,))
+
+    def extend(self, v):
+        chunks = self._chunks
+        size = self._chunk_size
+        v = iter(v)
+        tail = chunks[-1]
+        room = size - len(tail._list)
+        if room > 0:
+            batch = list(islice(v, room))
+            if batch:
+                tail._list.extend(batch)
+                tail._p_changed = True
+        while True:
+            batch = list(islice(v, size))
+            if not batch:
+                break
+            chunks.append(_AccumulatorChunk(batch))
+            self._p_changed = True
+
+    def consume(self, max_items=None):
+        """ Remove and return the oldest items, up to `max_items` of them.
+
+        - If `max_items` is None, remove and return all items.
+        """
+        chunks = self._chunks
+        result = []
+        retired = 0
+        for chunk in chunks[:-1]:
+            if (max_items is not None and
+                    len(result) + len(chunk._list) > max_items):
+                break
+            result.extend(chunk._list)
+            chunk._list = None
+            retired += 1
+        chunk = chunks[retired]
+        count = len(chunk._list)
+        if max_items is not None:
+            count = min(count, max(max_items - len(result), 0))
+        if count:
+            result.extend(chunk._list[:count])
+            del chunk._list[:count]
+            chunk._consumed += count
+            chunk._p_changed = True
+        if retired:
+            self._chunks = chunks[retired:]
+        return result
+
+    def drain(self, batch_size=100):
+        """ Consume and yield lists of at most `batch_size` items.
+
+        - Stop when no items remain.
+
+        - Each batch is consumed as it is yielded:  callers wanting bounded
+          transactions should commit after processing each batch.  Each
+          commit then writes the chunks the batch emptied or touched, plus
+          our own record, rather than the items remaining.
+
+        - Raise ValueError if `batch_size` is less than one.
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be at least 1')
+        return _drain(self, batch_size)
+
+    def __getstate__(self):
+        return (self._chunk_size, self._chunks)
+
+    def __setstate__(self, state):
+        self._chunk_size, self._chunks = state
+
+    #
+    # ZODB Conflict resolution
+    #
+    # Our own record changes only when appending adds chunks, or when
+    # consuming drops all but the tail chunk.  The contents of the chunks
+    # are resolved by the chunks themselves.
+    # - Keep those of old's chunks which neither side has dropped:  a
+    #   dropped chunk has been retired.
+    # - Then add the chunks added in committed, followed by those added in
+    #   new.
+    #
+    def _p_resolveConflict(self, old, committed, new):
+        o_size, o_chunks = old
+        c_size, c_chunks = committed
+        n_size, n_chunks = new
+        if not o_size == c_size == n_size:
+            raise ConflictError('Conflicting chunk size')
+        o_oids = set(_refOids(o_chunks))
+        c_oids = set(_refOids(c_chunks))
+        n_oids = set(_refOids(n_chunks))
+        kept = [x for x in o_chunks if x.oid in c_oids and x.oid in n_oids]
+        c_added = [x for x in c_chunks if x.oid not in o_oids]
+        n_added = [x for x in n_chunks if x.oid not in o_oids]
+        return (c_size, kept + c_added + n_added)
@@ -0,0 +1,135 @@
+##############################################################################
+#
+# Copyright (c) 2010, 2026 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Micro-benchmarks for ``appendonly`` data structures.
+
+Each module is runnable as a script, e.g.::
+
+  $ python -m appendonly.benchmarks.push
+
+Run the whole suite, optionally saving results or comparing them against a
+saved run (see ``python -m appendonly.benchmarks --help``)::
+
+  $ python -m appendonly.benchmarks --output results.json
+  $ python -m appendonly.benchmarks --compare baseline.json
+"""
+from collections import namedtuple
+import time
+
+#: One benchmark table.
+#:
+#: - `name` keys its results in saved output.
+#: - `columns` names the values in each row returned by `run(quick=False)`.
+#: - The first `keys` values of a row identify it (the parameters), and the
+#:   rest are timings or sizes.
+Benchmark = namedtuple('Benchmark', 'name title columns keys run')
+
+MODULES = ('push', 'newer', 'pickling', 'layers', 'resolve', 'archive')
+
+
+def best_of(func, repeat=5, number=1):
+    """ Return the best wall-clock time, in seconds, of `number` calls.
+    """
+    timer = getattr(time, 'perf_counter', time.time)
+    best = None
+    for _ in range(repeat):
+        started = timer()
+        for _ in range(number):
+            func()
+        elapsed = timer() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / number
+
+
+def report(title, rows, columns):
+    """ Print a simple fixed-width table of `rows` (sequences of values).
+    """
+    print(title)
+    print('  '.join('%14s' % x for x in columns))
+    for row in rows:
+        print('  '.join(_format(x) for x in row))
+    print('')
+
+
+def _format(value):
+    if isinstance(value, float):
+        return '%14.3f' % value
+    return '%14s' % (value,)
+
+
+def main(benchmarks, quick=False):
+    """ Run and print each of `benchmarks`.
+    """
+    for benchmark in benchmarks:
+        report(benchmark.title, benchmark.run(quick), benchmark.columns)
+
+
+def suite(modules=MODULES):
+    """ Return the benchmarks defined by each of `modules`, in order.
+    """
+    benchmarks = []
+    for name in modules:
+        dotted = '%s.%s' % (__name__, name)
+        module = __import__(dotted, fromlist=['BENCHMARKS'])
+        benchmarks.extend(module.BENCHMARKS)
+    return benchmarks
+
+
+def run_suite(benchmarks, quick=False, echo=None):
+    """ Run `benchmarks`, returning a mapping suitable for saving as JSON.
+
+    - If passed, call `echo(benchmark, rows)` after each one runs.
+    """
+    results = {}
+    for benchmark in benchmarks:
+        rows = [list(row) for row in benchmark.run(quick)]
+        results[benchmark.name] = {
+            'title': benchmark.title,
+            'columns': list(benchmark.columns),
+            'keys': benchmark.keys,
+            'rows': rows,
+        }
+        if echo is not None:
+            echo(benchmark, rows)
+    return results
+
+
+def compare(baseline, current):
+    """ Return rows comparing `current` results against `baseline`.
+
+    - Each row is (benchmark, parameters, column, baseline, current, ratio),
+      where ratio is `current / baseline`:  below 1.0 is an improvement.
+
+    - Only rows present in both results, with matching parameters, are
+      compared.
+    """
+    rows = []
+    for name in sorted(current):
+        if name not in baseline:
+            continue
+        result = current[name]
+        keys = result['keys']
+        columns = result['columns']
+        before = dict((tuple(row[:keys]), row)
+                      for row in baseline[name]['rows'])
+        for row in result['rows']:
+            params = tuple(row[:keys])
+            old = before.get(params)
+            if old is None:
+                continue
+            label = '/'.join(str(x) for x in params)
+            for column, was, now in zip(columns[keys:], old[keys:],
+                                        row[keys:]):
+                ratio = now / was if was else float('nan')
+                rows.append((name, label, column, was, now, ratio))
+    return rows
@@ -0,0 +1,63 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Run the benchmark suite:  ``python -m appendonly.benchmarks``.
+"""
+import argparse
+import json
+import sys
+
+from appendonly.benchmarks import MODULES
+from appendonly.benchmarks import compare
+from appendonly.benchmarks import report
+from appendonly.benchmarks import run_suite
+from appendonly.benchmarks import suite
+
+
+def _echo(benchmark, rows):
+    report(benchmark.title, rows, benchmark.columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m appendonly.benchmarks',
+        description='Benchmark appendonly data structures.')
+    parser.add_argument('modules', nargs='*', metavar='MODULE',
+                        help='Benchmark modules to run (default: %s).'
+                             % ', '.join(MODULES))
+    parser.add_argument('--quick', action='store_true',
+                        help='Use smaller sizes and fewer repetitions.')
+    parser.add_argument('--output', metavar='FILE',
+                        help='Save results as JSON to FILE.')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='Compare results against those saved in FILE.')
+    options = parser.parse_args(argv)
+
+    benchmarks = suite(options.modules or MODULES)
+    results = run_suite(benchmarks, options.quick, echo=_echo)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        report('Compared to %s (ratio < 1 is faster / smaller)'
+               % options.compare,
+               compare(baseline, results),
+               ('benchmark', 'parameters', 'column', 'baseline', 'current',
+                'ratio'))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
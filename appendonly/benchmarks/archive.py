@@ -0,0 +1,96 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Measure cold scans of an ``Archive`` stored in a database.
+
+Each scan starts with the connection's cache minimized, so that every
+layer must be loaded from the storage.
+"""
+import os
+import shutil
+import tempfile
+
+import transaction
+from ZODB.DB import DB
+from ZODB.FileStorage import FileStorage
+from ZODB.MappingStorage import MappingStorage
+
+from appendonly import Archive
+from appendonly.benchmarks import Benchmark
+from appendonly.benchmarks import best_of
+from appendonly.benchmarks import main
+
+LAYERS = 1000
+LENGTH = 100
+
+
+def _fill(db, indexed, layers):
+    tm = transaction.TransactionManager()
+    conn = db.open(transaction_manager=tm)
+    archive = conn.root()['archive'] = Archive(indexed=indexed)
+    for generation in range(layers):
+        archive.addLayer(generation, range(LENGTH))
+    tm.commit()
+    conn.close()
+
+
+def _scan(conn, start=None, stop=None, reverse=False):
+    def _run():
+        conn.cacheMinimize()
+        for _ in conn.root()['archive'].iter_range(start, stop, reverse):
+            pass
+    return _run
+
+
+def _storages(tmpdir):
+    yield 'mapping', MappingStorage()
+    yield 'file', FileStorage(os.path.join(tmpdir, 'Data.fs'))
+
+
+def run(quick=False):
+    """ Return a list of (layers, storage, indexed, newest-first,
+    oldest-first, oldest 10 layers) timings in msec.
+    """
+    layers = LAYERS // 10 if quick else LAYERS
+    window = ((0, 0), (10, 0))
+    rows = []
+    for indexed in (False, True):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for name, storage in _storages(tmpdir):
+                db = DB(storage)
+                try:
+                    _fill(db, indexed, layers)
+                    conn = db.open()
+                    reverse = best_of(_scan(conn, reverse=True), repeat=3)
+                    forward = best_of(_scan(conn), repeat=3)
+                    oldest = best_of(_scan(conn, *window), repeat=3)
+                    conn.close()
+                finally:
+                    db.close()
+                rows.append((layers, name, indexed,
+                             reverse * 1e3, forward * 1e3, oldest * 1e3))
+        finally:
+            shutil.rmtree(tmpdir)
+    return rows
+
+
+BENCHMARKS = [
+    Benchmark('archive', 'Archive cold scans (msec, %d items per layer)'
+              % LENGTH,
+              ('layers', 'storage', 'indexed', 'newest-first',
+               'oldest-first', 'oldest 10'), 3, run),
+]
+
+
+if __name__ == '__main__':
+    main(BENCHMARKS)
@@ -0,0 +1,109 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Compare slotted layers and list-adopting ``__setstate__`` to the originals.
+
+The original ``_Layer`` carried a per-instance ``__dict__``, and
+``AppendStack.__setstate__`` rebuilt each layer by pushing its items one
+at a time.
+"""
+import pickle
+import sys
+
+from appendonly import AppendStack
+from appendonly import _Layer
+from appendonly.benchmarks import Benchmark
+from appendonly.benchmarks import best_of
+from appendonly.benchmarks import main
+
+
+class LegacyLayer(object):
+
+    def __init__(self, max_length=100, generation=0):
+        self._stack = []
+        self._max_length = max_length
+        self._generation = generation
+
+    def push(self, obj):
+        if len(self._stack) >= self._max_length:
+            raise ValueError()
+        self._stack.append(obj)
+
+
+def legacy_setstate(stack, state):
+    stack._max_layers, stack._max_length, layer_data = state
+    stack._layers = []
+    for generation, items in layer_data:
+        layer = LegacyLayer(stack._max_length, generation)
+        for item in items:
+            layer.push(item)
+        stack._layers.append(layer)
+
+
+def layer_size(layer):
+    """ Return the bytes used by `layer` itself (not its items' list).
+    """
+    size = sys.getsizeof(layer)
+    if hasattr(layer, '__dict__'):
+        size += sys.getsizeof(layer.__dict__)
+    return size
+
+
+def _activate(setstate, data):
+    # Mimic ghost activation:  unpickle the state, then apply it.
+    def _run():
+        stack = AppendStack.__new__(AppendStack)
+        setstate(stack, pickle.loads(data))
+    return _run
+
+
+SHAPES = [(10, 100), (10, 1000), (100, 10)]
+
+
+def run_memory(quick=False):
+    """ Return a list of (class, bytes per layer object).
+    """
+    return [('legacy', layer_size(LegacyLayer())),
+            ('slotted', layer_size(_Layer()))]
+
+
+def run_activation(quick=False, shapes=SHAPES):
+    """ Return a list of (max_layers, max_length, unpickle, legacy, current).
+
+    Times are in microseconds per activation (including unpickling).
+    """
+    number = 5 if quick else 20
+    rows = []
+    for max_layers, max_length in shapes:
+        stack = AppendStack(max_layers, max_length)
+        stack.push_many(range(max_layers * max_length))
+        data = pickle.dumps(stack.__getstate__(), 2)
+        bare = best_of(lambda: pickle.loads(data), number=number)
+        legacy = best_of(_activate(legacy_setstate, data), number=number)
+        current = best_of(_activate(AppendStack.__setstate__, data),
+                          number=number)
+        rows.append((max_layers, max_length,
+                     bare * 1e6, legacy * 1e6, current * 1e6))
+    return rows
+
+
+BENCHMARKS = [
+    Benchmark('layer_size', 'Layer object size (bytes)',
+              ('layer', 'bytes'), 1, run_memory),
+    Benchmark('activation', 'AppendStack activation (usec)',
+              ('max_layers', 'max_length', 'unpickle', 'legacy', 'current'),
+              2, run_activation),
+]
+
+
+if __name__ == '__main__':
+    main(BENCHMARKS)
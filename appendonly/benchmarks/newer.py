@@ -0,0 +1,67 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Measure ``AppendStack.newer`` by how far behind the head a cursor is.
+
+Pollers typically hold a cursor near the head of the stack:  their cost
+should track the number of items newer than the cursor, not the size of
+the stack.
+"""
+from appendonly import AppendStack
+from appendonly.benchmarks import Benchmark
+from appendonly.benchmarks import best_of
+from appendonly.benchmarks import main
+
+AGES = [1, 100, 1000, 9000]
+
+
+def _cursor(stack, age):
+    # Return the (generation, index) of the item `age` items behind the
+    # most recent one.
+    found = None
+    for found in stack:
+        age -= 1
+        if age < 0:
+            break
+    return found[:2]
+
+
+def _newer(stack, cursor, limit):
+    def _run():
+        for _ in stack.newer(cursor[0], cursor[1], limit):
+            pass
+    return _run
+
+
+def run(quick=False, ages=AGES, max_layers=100, max_length=100):
+    """ Return a list of (cursor age, unlimited, limit=10) timings in usec.
+    """
+    number = 10 if quick else 100
+    stack = AppendStack(max_layers, max_length)
+    stack.push_many(range(max_layers * max_length))
+    rows = []
+    for age in ages:
+        cursor = _cursor(stack, age)
+        unlimited = best_of(_newer(stack, cursor, None), number=number)
+        limited = best_of(_newer(stack, cursor, 10), number=number)
+        rows.append((age, unlimited * 1e6, limited * 1e6))
+    return rows
+
+
+BENCHMARKS = [
+    Benchmark('newer', 'AppendStack.newer (usec per call, 10000 items)',
+              ('cursor age', 'unlimited', 'limit=10'), 1, run),
+]
+
+
+if __name__ == '__main__':
+    main(BENCHMARKS)
@@ -0,0 +1,78 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Measure ``AppendStack`` state pickling, untyped and typed.
+
+ZODB pickles ``__getstate__`` when committing a stack, and unpickles and
+passes the state to ``__setstate__`` when activating one.
+"""
+import pickle
+
+from appendonly import AppendStack
+from appendonly.benchmarks import Benchmark
+from appendonly.benchmarks import best_of
+from appendonly.benchmarks import main
+
+SHAPES = [(10, 100), (10, 1000)]
+TYPECODES = [None, 'l', 'd']
+
+
+def _filled(max_layers, max_length, typecode):
+    stack = AppendStack(max_layers, max_length, typecode=typecode)
+    count = max_layers * max_length
+    if typecode == 'd':
+        stack.push_many(x * 0.5 for x in range(count))
+    else:
+        stack.push_many(range(count))
+    return stack
+
+
+def _dumps(stack):
+    def _run():
+        pickle.dumps(stack.__getstate__(), 2)
+    return _run
+
+
+def _loads(data):
+    def _run():
+        AppendStack().__setstate__(pickle.loads(data))
+    return _run
+
+
+def run(quick=False, shapes=SHAPES, typecodes=TYPECODES):
+    """ Return a list of (max_layers, max_length, typecode, dumps, loads,
+    bytes).
+
+    Times are in microseconds per stack.
+    """
+    number = 5 if quick else 20
+    rows = []
+    for max_layers, max_length in shapes:
+        for typecode in typecodes:
+            stack = _filled(max_layers, max_length, typecode)
+            data = pickle.dumps(stack.__getstate__(), 2)
+            dumps = best_of(_dumps(stack), number=number)
+            loads = best_of(_loads(data), number=number)
+            rows.append((max_layers, max_length, typecode or '-',
+                         dumps * 1e6, loads * 1e6, len(data)))
+    return rows
+
+
+BENCHMARKS = [
+    Benchmark('pickling', 'AppendStack state pickling (usec per stack)',
+              ('max_layers', 'max_length', 'typecode', 'dumps', 'loads',
+               'bytes'), 3, run),
+]
+
+
+if __name__ == '__main__':
+    main(BENCHMARKS)
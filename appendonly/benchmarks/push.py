@@ -0,0 +1,97 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Compare ``AppendStack.push`` against the exception-based original.
+
+The original caught ``_LayerFull`` to roll over to a new layer, and rebuilt
+the layers list on every call, whether or not anything was pruned.
+"""
+from appendonly import AppendStack
+from appendonly import _Layer
+from appendonly.benchmarks import Benchmark
+from appendonly.benchmarks import best_of
+from appendonly.benchmarks import main
+
+
+class _LayerFull(ValueError):
+    pass
+
+
+def _legacyLayerPush(layer, obj):
+    # The original '_Layer.push'.
+    if len(layer._stack) >= layer._max_length:
+        raise _LayerFull()
+    layer._stack.append(obj)
+
+
+def legacy_push(stack, obj, pruner=None):
+    layers = stack._layers
+    max = stack._max_layers
+    try:
+        _legacyLayerPush(layers[0], obj)
+    except _LayerFull:
+        new_layer = _Layer(stack._max_length,
+                           generation=layers[0]._generation+1)
+        _legacyLayerPush(new_layer, obj)
+        stack._layers.insert(0, new_layer)
+    stack._layers, pruned = layers[:max], layers[max:]
+    if pruner is not None:
+        for layer in pruned:
+            pruner(layer._generation, layer._stack)
+
+
+def _pushAll(push, max_layers, max_length, count):
+    def _run():
+        stack = AppendStack(max_layers, max_length)
+        for obj in range(count):
+            push(stack, obj)
+    return _run
+
+
+def _pushMany(max_layers, max_length, count):
+    def _run():
+        stack = AppendStack(max_layers, max_length)
+        stack.push_many(range(count))
+    return _run
+
+
+SHAPES = [(10, 100), (10, 10), (2, 1)]
+
+
+def run(quick=False, shapes=SHAPES):
+    """ Return a list of (max_layers, max_length, legacy, push, push_many).
+
+    Times are in microseconds per pushed item.
+    """
+    count = 10000 if quick else 100000
+    current = AppendStack.push
+    rows = []
+    for max_layers, max_length in shapes:
+        legacy = best_of(_pushAll(legacy_push, max_layers, max_length, count))
+        new = best_of(_pushAll(current, max_layers, max_length, count))
+        bulk = best_of(_pushMany(max_layers, max_length, count))
+        rows.append((max_layers, max_length,
+                     legacy * 1e6 / count,
+                     new * 1e6 / count,
+                     bulk * 1e6 / count))
+    return rows
+
+
+BENCHMARKS = [
+    Benchmark('push', 'AppendStack push (usec per item)',
+              ('max_layers', 'max_length', 'legacy', 'push', 'push_many'),
+              2, run),
+]
+
+
+if __name__ == '__main__':
+    main(BENCHMARKS)
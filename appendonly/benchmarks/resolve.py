@@ -0,0 +1,188 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Compare conflict resolution against the original implementations.
+
+The original popped new items off the front of a list one at a time, built
+that list by repeated prepends, and copied every committed layer, making
+it quadratic in the number of conflicting items.
+
+The original ``Accumulator`` resolver compared the old list against a prefix
+of each side's list, making it linear in the number of accumulated items.
+"""
+from appendonly import Accumulator
+from appendonly import AppendStack
+from appendonly import Archive
+from appendonly import ConflictError
+from appendonly import _resolveAppends
+from appendonly.benchmarks import Benchmark
+from appendonly.benchmarks import best_of
+from appendonly.benchmarks import main
+
+
+def legacy_resolve(old, committed, new):
+    o_m_layers, o_m_length, o_layers = old
+    c_m_layers, c_m_length, c_layers = committed
+    m_layers = [x[:] for x in c_layers]
+    n_m_layers, n_m_length, n_layers = new
+
+    if not o_m_layers == n_m_layers == n_m_layers:
+        raise ConflictError('Conflicting max layers')
+
+    if not o_m_length == c_m_length == n_m_length:
+        raise ConflictError('Conflicting max length')
+
+    o_latest_gen = o_layers[0][0]
+    o_latest_items = o_layers[0][1]
+    c_earliest_gen = c_layers[-1][0]
+    n_earliest_gen = n_layers[-1][0]
+
+    if o_latest_gen < c_earliest_gen:
+        raise ConflictError('Committed obsoletes old')
+
+    if o_latest_gen < n_earliest_gen:
+        raise ConflictError('New obsoletes old')
+
+    new_objects = []
+    for n_generation, n_items in n_layers:
+        if n_generation > o_latest_gen:
+            new_objects[:0] = n_items
+        elif n_generation == o_latest_gen:
+            new_objects[:0] = n_items[len(o_latest_items):]
+        else:
+            break
+
+    while new_objects:
+        to_push, new_objects = new_objects[0], new_objects[1:]
+        if len(m_layers[0][1]) == c_m_length:
+            m_layers.insert(0, (m_layers[0][0]+1, []))
+        m_layers[0][1].append(to_push)
+
+    return c_m_layers, c_m_length, m_layers[:c_m_layers]
+
+
+def conflict_states(size, max_length=100, existing=550, committed=10):
+    """ Return (old, committed, new) states for a conflict of `size` items.
+
+    `max_layers` is chosen so that neither side rolls past the old state.
+    """
+    max_layers = (existing + committed + size) // max_length + 2
+
+    def _state(extra):
+        stack = AppendStack(max_layers, max_length)
+        stack.push_many(range(existing))
+        stack.push_many(extra)
+        return stack.__getstate__()
+
+    return (_state(()),
+            _state(['c%d' % x for x in range(committed)]),
+            _state(['n%d' % x for x in range(size)]))
+
+
+def _resolver(resolve, states):
+    # The resolver may mutate the committed state in place:  give each
+    # call a fresh copy of its lists.
+    def _run():
+        old, committed, new = states
+        committed = (committed[0], committed[1],
+                     [(gen, items[:]) for gen, items in committed[2]])
+        resolve(old, committed, new)
+    return _run
+
+
+def accumulator_states(size, appended=10):
+    """ Return (old, committed, new) list-only and counted Accumulator states.
+
+    Both sides append `appended` items to an old list of `size` items.
+    """
+    o_list = ['o%d' % x for x in range(size)]
+    c_list = o_list + ['c%d' % x for x in range(appended)]
+    n_list = o_list + ['n%d' % x for x in range(appended)]
+    return ((o_list, c_list, n_list),
+            ((0, o_list), (0, c_list), (0, n_list)))
+
+
+SIZES = [10, 100, 1000, 5000]
+ACCUMULATOR_SIZES = [100, 10000, 100000]
+
+
+def run(quick=False, sizes=SIZES):
+    """ Return a list of (conflict size, legacy, current) timings in msec.
+    """
+    if quick:
+        sizes = sizes[:-1]
+    current = AppendStack()._p_resolveConflict
+    rows = []
+    for size in sizes:
+        states = conflict_states(size)
+        legacy = best_of(_resolver(legacy_resolve, states), repeat=3)
+        new = best_of(_resolver(current, states), repeat=3)
+        rows.append((size, legacy * 1e3, new * 1e3))
+    return rows
+
+
+def run_accumulator(quick=False, sizes=ACCUMULATOR_SIZES):
+    """ Return a list of (old items, list-only, counted) timings in msec.
+
+    "list-only" compares item prefixes, as resolution of states written
+    before `Accumulator` tracked its consumed count must;  "counted" uses
+    that count.
+    """
+    if quick:
+        sizes = sizes[:-1]
+    current = Accumulator()._p_resolveConflict
+    rows = []
+    for size in sizes:
+        legacy_states, counted_states = accumulator_states(size)
+        legacy = best_of(lambda: _resolveAppends(*legacy_states), repeat=3)
+        counted = best_of(lambda: current(*counted_states), repeat=3)
+        rows.append((size, legacy * 1e3, counted * 1e3))
+    return rows
+
+
+def run_archive(quick=False):
+    """ Return a list of (layers, usec) timings of a resolvable conflict.
+
+    Both sides have added the same layer (the usual case:  concurrent
+    pruning of the same stack);  the cost should not depend on the number
+    of layers.
+    """
+    number = 100 if quick else 1000
+    current = Archive()._p_resolveConflict
+    rows = []
+    for layers in (10, 1000):
+        archive = Archive()
+        for generation in range(layers):
+            archive.addLayer(generation, [generation])
+        old = archive.__getstate__()
+        archive.addLayer(layers, [layers])
+        committed = archive.__getstate__()
+        states = (old, committed, dict(committed))
+        elapsed = best_of(lambda: current(*states), number=number)
+        rows.append((layers, elapsed * 1e6))
+    return rows
+
+
+BENCHMARKS = [
+    Benchmark('resolve', 'AppendStack._p_resolveConflict (msec per conflict)',
+              ('new items', 'legacy', 'current'), 1, run),
+    Benchmark('resolve_accumulator',
+              'Accumulator._p_resolveConflict (msec per conflict)',
+              ('old items', 'list-only', 'counted'), 1, run_accumulator),
+    Benchmark('resolve_archive',
+              'Archive._p_resolveConflict (usec per conflict)',
+              ('layers', 'current'), 1, run_archive),
+]
+
+
+if __name__ == '__main__':
+    main(BENCHMARKS)
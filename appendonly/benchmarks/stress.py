@@ -0,0 +1,192 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Stress conflict resolution with concurrent writers.
+
+Each writer thread has its own connection to a shared ``FileStorage``
+database, and repeatedly adds one item to the same hot object and
+commits, counting commits which fail with an unresolved ``ConflictError``.
+The storage counts the conflicts it resolves on the writers' behalf.
+
+This module is not part of the default suite;  run it with::
+
+  $ python -m appendonly.benchmarks.stress
+  $ python -m appendonly.benchmarks stress --output stress.json
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import transaction
+from ZODB.DB import DB
+from ZODB.FileStorage import FileStorage
+
+from appendonly import Accumulator
+from appendonly import AppendStack
+from appendonly import BucketedAppendStack
+from appendonly import ChunkedAccumulator
+from appendonly import ConflictError
+from appendonly.benchmarks import Benchmark
+from appendonly.benchmarks import main
+
+
+class CountingFileStorage(FileStorage):
+    """ File storage counting the write conflicts it resolves or fails to.
+    """
+    resolved = failed = 0
+
+    def __init__(self, *args, **kw):
+        FileStorage.__init__(self, *args, **kw)
+        self._counts_lock = threading.Lock()
+
+    def tryToResolveConflict(self, *args, **kw):
+        try:
+            result = FileStorage.tryToResolveConflict(self, *args, **kw)
+        except ConflictError:
+            with self._counts_lock:
+                self.failed += 1
+            raise
+        with self._counts_lock:
+            self.resolved += 1
+        return result
+
+
+def _push(target, item):
+    target.push(item)
+
+
+def _append(target, item):
+    target.append(item)
+
+
+#: (name, factory, operation) for each structure under test.
+STRUCTURES = [
+    ('AppendStack', AppendStack, _push),
+    ('BucketedAppendStack', BucketedAppendStack, _push),
+    ('Accumulator', Accumulator, _append),
+    ('ChunkedAccumulator', ChunkedAccumulator, _append),
+]
+
+WRITERS = [1, 2, 4, 8]
+
+
+class _Writer(threading.Thread):
+
+    def __init__(self, db, number, operation, stop_at):
+        threading.Thread.__init__(self)
+        self.db = db
+        self.number = number
+        self.operation = operation
+        self.stop_at = stop_at
+        self.commits = 0
+        self.conflicts = 0
+        self.latencies = []
+
+    def run(self):
+        timer = getattr(time, 'perf_counter', time.time)
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        try:
+            count = 0
+            while timer() < self.stop_at:
+                started = timer()
+                tm.begin()
+                self.operation(conn.root()['target'], (self.number, count))
+                try:
+                    tm.commit()
+                except ConflictError:
+                    tm.abort()
+                    self.conflicts += 1
+                else:
+                    self.commits += 1
+                    count += 1
+                    self.latencies.append(timer() - started)
+        finally:
+            conn.close()
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return float('nan')
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def stress(factory, operation, writers, duration):
+    """ Run `writers` threads against one `factory()` object for
+    `duration` seconds.
+
+    Return (commits, resolved, unresolved, sorted commit latencies).
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        storage = CountingFileStorage(os.path.join(tmpdir, 'Data.fs'))
+        db = DB(storage, pool_size=writers)
+        try:
+            tm = transaction.TransactionManager()
+            conn = db.open(transaction_manager=tm)
+            conn.root()['target'] = factory()
+            tm.commit()
+            conn.close()
+            storage.resolved = storage.failed = 0
+            stop_at = getattr(time, 'perf_counter', time.time)() + duration
+            threads = [_Writer(db, number, operation, stop_at)
+                       for number in range(writers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            db.close()
+    finally:
+        shutil.rmtree(tmpdir)
+    latencies = sorted(sum([x.latencies for x in threads], []))
+    commits = sum(x.commits for x in threads)
+    unresolved = sum(x.conflicts for x in threads)
+    return commits, storage.resolved, unresolved, latencies
+
+
+def run(quick=False, structures=STRUCTURES, writers=WRITERS):
+    """ Return a list of (structure, writers, commits/sec, resolved %,
+    unresolved %, p50, p90, p99).
+
+    Rates are percentages of attempted commits;  latencies of successful
+    commits are in msec.
+    """
+    duration = 0.5 if quick else 3.0
+    rows = []
+    for name, factory, operation in structures:
+        for count in writers:
+            commits, resolved, unresolved, latencies = stress(
+                factory, operation, count, duration)
+            attempts = (commits + unresolved) or 1
+            rows.append((name, count,
+                         commits / duration,
+                         resolved * 100.0 / attempts,
+                         unresolved * 100.0 / attempts,
+                         _percentile(latencies, 0.5) * 1e3,
+                         _percentile(latencies, 0.9) * 1e3,
+                         _percentile(latencies, 0.99) * 1e3))
+    return rows
+
+
+BENCHMARKS = [
+    Benchmark('stress', 'Concurrent writers, one hot object',
+              ('structure', 'writers', 'commits/sec', 'resolved %',
+               'unresolved %', 'p50 msec', 'p90 msec', 'p99 msec'),
+              2, run),
+]
+
+
+if __name__ == '__main__':
+    main(BENCHMARKS)
@@ -29,16 +29,92 @@ class IAppendStack(Interface):
         """ Yield (generation, index, object) in most-recent first order.
         """
 
-    def newer(latest_gen, latest_index):
+    def __getitem__(key):
+        """ Return the item at the (generation, index) `key`.
+
+        - Raise KeyError if no such item is retained in the stack.
+        """
+
+    def get(key, default=None):
+        """ Return the item at the (generation, index) `key`.
+
+        - Return `default` if no such item is retained in the stack.
+        """
+
+    def newer(latest_gen, latest_index, limit=None):
         """ Yield items newer than (`latest_gen`, `latest_index`).
         
         Implemented as a method on the layer to work around lack of generator
         expressions in Python 2.5.x.
+
+        - Items are yielded in most-recent first order.
+
+        - If `limit` is passed, yield at most that many (most recent) items.
         """
 
-    def push(obj, pruner=None):
+    def newer_slices(latest_gen=-1, latest_index=-1):
+        """ Yield (generation, first_index, items) for items newer than
+        (`latest_gen`, `latest_index`).
+
+        - Yield one tuple per layer, most-recent layer first;  `items` is
+          a sequence of that layer's items in the order appended, starting
+          at `first_index`.
+
+        - For stacks created with a `typecode`, `items` for layers other
+          than the most recent is a zero-copy `memoryview`.
+        """
+
+    def iter_range(start=None, stop=None, reverse=False):
+        """ Yield (generation, index, object) tuples within a key range.
+
+        - `start` and `stop` are (generation, index) keys;  `start` is
+          inclusive, `stop` exclusive, and either may be None to leave that
+          end of the range open.
+
+        - Items are yielded oldest-first, or most-recent first if `reverse`
+          is true.
+        """
+
+    def poll(cursor=None, limit=None):
+        """ Return items added since a reader's last poll.
+
+        - `cursor` is the `appendonly.Cursor` returned by the previous poll,
+          or any (generation, index) key;  if None, poll from the start.
+
+        - Return a tuple, (items, cursor, gap):
+
+          o `items` is a list of the (generation, index, object) tuples
+            following `cursor`, oldest first, and at most `limit` of them.
+
+          o `cursor` is the key of the last item returned (or the passed
+            cursor, if none were):  pass it to the next poll.
+
+          o `gap` is true if items following the passed cursor may have
+            been pruned from the stack, i.e., if the layer holding the
+            cursor has been pruned:  the reader may fetch any such items
+            from an archive, between the passed cursor and the first item
+            returned.
+        """
+
+    def push(obj, pruner=None, retention=None):
         """ Append an item to the stack.
 
         - If `pruner` is passed, call it with the generation and items of
           any pruned layer.
+
+        - If `retention` is passed, also prune the layers it rejects (see
+          `appendonly.Retention`).
+        """
+
+    def push_many(objs, pruner=None, retention=None):
+        """ Append each item from the iterable `objs` to the stack.
+
+        - Fill the current layer, then add as many new layers as needed.
+
+        - Prune layers once, after all items have been added:  if `pruner`
+          is passed, call it with the generation and items of each pruned
+          layer, oldest first.
+
+        - If `retention` is passed, also prune the layers it rejects (see
+          `appendonly.Retention`).
         """
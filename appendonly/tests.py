@@ -54,57 +54,32 @@ class LayerTests(unittest.TestCase, _LayerTestBase):
         return _Layer
 
     def test___iter___filled(self):
-        layer = self._makeOne()
         OBJ1 = object()
         OBJ2 = object()
         OBJ3 = object()
-        layer.push(OBJ1)
-        layer.push(OBJ2)
-        layer.push(OBJ3)
+        layer = self._makeOne(items=[OBJ1, OBJ2, OBJ3])
         self.assertEqual(list(layer), [(2, OBJ3), (1, OBJ2), (0, OBJ1)])
 
     def test_newer_miss(self):
-        layer = self._makeOne()
-        layer.push(object())
+        layer = self._makeOne(items=[object()])
         self.assertEqual(list(layer.newer(0)), [])
 
     def test_newer_hit(self):
-        layer = self._makeOne()
         OBJ1 = object()
         OBJ2 = object()
         OBJ3 = object()
-        layer.push(OBJ1)
-        layer.push(OBJ2)
-        layer.push(OBJ3)
+        layer = self._makeOne(items=[OBJ1, OBJ2, OBJ3])
         self.assertEqual(list(layer.newer(0)),
                          [(2, OBJ3), (1, OBJ2)])
 
-    def test_push_one(self):
-        layer = self._makeOne()
-        OBJ = object()
-        layer.push(OBJ)
-        self.assertEqual(list(layer), [(0, OBJ)])
-
-    def test_push_many(self):
+    def test_is_slotted(self):
         layer = self._makeOne()
-        OBJ1, OBJ2, OBJ3 = object(), object(), object()
-        layer.push(OBJ1)
-        layer.push(OBJ2)
-        layer.push(OBJ3)
-        self.assertEqual(list(layer), [(2, OBJ3),
-                                       (1, OBJ2),
-                                       (0, OBJ1),
-                                      ])
+        self.assertFalse(hasattr(layer, '__dict__'))
 
-    def test_push_overflow(self):
-        layer = self._makeOne(2)
-        OBJ1, OBJ2, OBJ3 = object(), object(), object()
-        layer.push(OBJ1)
-        layer.push(OBJ2)
-        self.assertRaises(ValueError, layer.push, OBJ3)
-        self.assertEqual(list(layer), [(1, OBJ2),
-                                       (0, OBJ1),
-                                      ])
+    def test_ctor_w_items(self):
+        ITEMS = [1, 2, 3]
+        layer = self._makeOne(4, 14, ITEMS)
+        self.assertTrue(layer._stack is ITEMS)
 
 
 class AppendStackTests(unittest.TestCase):
@@ -174,6 +149,225 @@ class AppendStackTests(unittest.TestCase):
         self.assertEqual(list(stack.newer(0, 0)),
                          [(1, 0, OBJ3), (0, 1, OBJ2)])
 
+    def test_newer_w_limit(self):
+        stack = self._makeOne(max_length=2)
+        for obj in range(5):
+            stack.push(obj)
+        self.assertEqual(list(stack.newer(0, 0, limit=3)),
+                         [(2, 0, 4), (1, 1, 3), (1, 0, 2)])
+
+    def test_newer_w_limit_zero(self):
+        stack = self._makeOne()
+        stack.push(object())
+        self.assertEqual(list(stack.newer(-1, -1, limit=0)), [])
+
+    def test_newer_skips_older_layers(self):
+        stack = self._makeOne(max_length=3)
+        for obj in range(30):
+            stack.push(obj)
+        # Older layers must not be touched.
+        for layer in stack._layers[3:]:
+            layer._stack = None
+        self.assertEqual(list(stack.newer(7, 1)),
+                         [(9, 2, 29), (9, 1, 28), (9, 0, 27),
+                          (8, 2, 26), (8, 1, 25), (8, 0, 24),
+                          (7, 2, 23),
+                         ])
+
+    def test_newer_w_pruned_generation(self):
+        stack = self._makeOne(max_layers=2, max_length=2)
+        for obj in range(8):
+            stack.push(obj)
+        self.assertEqual(list(stack.newer(0, 1)),
+                         [(3, 1, 7), (3, 0, 6), (2, 1, 5), (2, 0, 4)])
+
+    def test_newer_w_future_generation(self):
+        stack = self._makeOne(max_length=2)
+        for obj in range(5):
+            stack.push(obj)
+        self.assertEqual(list(stack.newer(3, 0)), [])
+
+    def test_newer_w_noncontiguous_generations(self):
+        stack = self._makeOne()
+        stack.__setstate__((10, 3, [(7, [70, 71]), (4, [40, 41, 42])]))
+        self.assertEqual(list(stack.newer(5, 0)), [(7, 1, 71), (7, 0, 70)])
+        self.assertEqual(list(stack.newer(4, 1)),
+                         [(7, 1, 71), (7, 0, 70), (4, 2, 42)])
+
+    def test___getitem___hit(self):
+        stack = self._makeOne(max_length=3)
+        stack.push_many(range(8))
+        self.assertEqual(stack[(0, 0)], 0)
+        self.assertEqual(stack[(1, 2)], 5)
+        self.assertEqual(stack[(2, 1)], 7)
+
+    def test___getitem___miss(self):
+        stack = self._makeOne(max_layers=2, max_length=3)
+        stack.push_many(range(8))
+        self.assertRaises(KeyError, stack.__getitem__, (0, 0))
+        self.assertRaises(KeyError, stack.__getitem__, (2, 2))
+        self.assertRaises(KeyError, stack.__getitem__, (2, -1))
+        self.assertRaises(KeyError, stack.__getitem__, (3, 0))
+
+    def test___getitem___noncontiguous_generations(self):
+        stack = self._makeOne()
+        stack.__setstate__((10, 3, [(7, [70, 71]), (4, [40, 41, 42])]))
+        self.assertEqual(stack[(4, 1)], 41)
+        self.assertRaises(KeyError, stack.__getitem__, (5, 0))
+
+    def test_get(self):
+        stack = self._makeOne()
+        OBJ = object()
+        stack.push(OBJ)
+        self.assertTrue(stack.get((0, 0)) is OBJ)
+        self.assertEqual(stack.get((0, 1)), None)
+        self.assertEqual(stack.get((0, 1), 42), 42)
+
+    def test_iter_range_empty(self):
+        stack = self._makeOne()
+        self.assertEqual(list(stack.iter_range()), [])
+
+    def test_iter_range_unbounded(self):
+        stack = self._makeOne(max_length=2)
+        for obj in range(5):
+            stack.push(obj)
+        self.assertEqual(list(stack.iter_range()),
+                         [(0, 0, 0), (0, 1, 1), (1, 0, 2), (1, 1, 3),
+                          (2, 0, 4)])
+        self.assertEqual(list(stack.iter_range(reverse=True)), list(stack))
+
+    def test_iter_range_bounded(self):
+        stack = self._makeOne(max_length=3)
+        for obj in range(12):
+            stack.push(obj)
+        self.assertEqual(list(stack.iter_range((1, 1), (3, 1))),
+                         [(1, 1, 4), (1, 2, 5), (2, 0, 6), (2, 1, 7),
+                          (2, 2, 8), (3, 0, 9)])
+        self.assertEqual(list(stack.iter_range((1, 1), (3, 1), reverse=True)),
+                         [(3, 0, 9), (2, 2, 8), (2, 1, 7), (2, 0, 6),
+                          (1, 2, 5), (1, 1, 4)])
+
+    def test_iter_range_start_only(self):
+        stack = self._makeOne(max_length=3)
+        for obj in range(8):
+            stack.push(obj)
+        self.assertEqual(list(stack.iter_range(start=(1, 2))),
+                         [(1, 2, 5), (2, 0, 6), (2, 1, 7)])
+
+    def test_iter_range_stop_only(self):
+        stack = self._makeOne(max_length=3)
+        for obj in range(8):
+            stack.push(obj)
+        self.assertEqual(list(stack.iter_range(stop=(1, 0))),
+                         [(0, 0, 0), (0, 1, 1), (0, 2, 2)])
+
+    def test_iter_range_outside_retained(self):
+        stack = self._makeOne(max_layers=2, max_length=2)
+        for obj in range(8):
+            stack.push(obj)
+        self.assertEqual(list(stack.iter_range(start=(5, 0))), [])
+        self.assertEqual(list(stack.iter_range(stop=(1, 0))), [])
+        self.assertEqual(list(stack.iter_range(start=(0, 0), stop=(3, 0))),
+                         [(2, 0, 4), (2, 1, 5)])
+
+    def test_iter_range_is_lazy(self):
+        stack = self._makeOne(max_length=3)
+        for obj in range(8):
+            stack.push(obj)
+        found = stack.iter_range()
+        self.assertEqual(next(found), (0, 0, 0))
+        stack.push(8)
+        self.assertEqual(list(found)[-2:], [(2, 1, 7), (2, 2, 8)])
+
+    def test_poll_empty(self):
+        from appendonly import Cursor
+        stack = self._makeOne()
+        items, cursor, gap = stack.poll()
+        self.assertEqual(items, [])
+        self.assertEqual(cursor, Cursor(-1, -1))
+        self.assertFalse(gap)
+
+    def test_poll_wo_cursor(self):
+        from appendonly import Cursor
+        stack = self._makeOne(max_length=2)
+        stack.push_many('abc')
+        items, cursor, gap = stack.poll()
+        self.assertEqual(items, [(0, 0, 'a'), (0, 1, 'b'), (1, 0, 'c')])
+        self.assertEqual(cursor, Cursor(1, 0))
+        self.assertFalse(gap)
+
+    def test_poll_resumes(self):
+        stack = self._makeOne(max_length=2)
+        stack.push_many('abc')
+        items, cursor, gap = stack.poll(limit=2)
+        self.assertEqual([x[2] for x in items], ['a', 'b'])
+        self.assertEqual(cursor, (0, 1))
+        stack.push_many('de')
+        items, cursor, gap = stack.poll(cursor)
+        self.assertEqual([x[2] for x in items], ['c', 'd', 'e'])
+        self.assertEqual(cursor, (2, 0))
+        self.assertFalse(gap)
+        items, after, gap = stack.poll(cursor)
+        self.assertEqual(items, [])
+        self.assertEqual(after, cursor)
+
+    def test_poll_w_plain_tuple(self):
+        from appendonly import Cursor
+        stack = self._makeOne(max_length=2)
+        stack.push_many('abc')
+        items, cursor, gap = stack.poll((0, 0))
+        self.assertEqual([x[2] for x in items], ['b', 'c'])
+        self.assertTrue(isinstance(cursor, Cursor))
+
+    def test_poll_gap(self):
+        stack = self._makeOne(max_layers=2, max_length=2)
+        stack.push_many(range(8)) # retains generations 2 and 3
+        items, cursor, gap = stack.poll((1, 0))
+        self.assertTrue(gap)
+        self.assertEqual(items, [(2, 0, 4), (2, 1, 5), (3, 0, 6), (3, 1, 7)])
+
+    def test_poll_gap_wo_cursor(self):
+        stack = self._makeOne(max_layers=2, max_length=2)
+        stack.push_many(range(8))
+        items, cursor, gap = stack.poll()
+        self.assertTrue(gap)
+        self.assertEqual(items[0], (2, 0, 4))
+
+    def test_poll_gap_at_end_of_pruned_layer(self):
+        # The pruned layer may have held more than 'max_length' items.
+        stack = self._makeOne(max_layers=2, max_length=2)
+        stack.push_many(range(8))
+        items, cursor, gap = stack.poll((1, 1))
+        self.assertTrue(gap)
+        self.assertEqual(items[0], (2, 0, 4))
+
+    def test_poll_gap_after_overfilled_layer_pruned(self):
+        stack = self._makeOne(max_layers=2, max_length=2)
+        stack.__setstate__((2, 2, [(1, [3, 4]), (0, [0, 1, 2])]))
+        stack.push_many([5, 6]) # prunes generation 0, unseen item 2
+        items, cursor, gap = stack.poll((0, 1))
+        self.assertTrue(gap)
+        self.assertEqual([x[2] for x in items], [3, 4, 5, 6])
+
+    def test_poll_no_gap_before_oldest_layer(self):
+        stack = self._makeOne(max_layers=2, max_length=2)
+        stack.push_many(range(8))
+        items, cursor, gap = stack.poll((2, -1))
+        self.assertFalse(gap)
+        self.assertEqual(items[0], (2, 0, 4))
+        items, cursor, gap = stack.poll((2, 0))
+        self.assertFalse(gap)
+        self.assertEqual(items[0], (2, 1, 5))
+
+    def test__layerPosition(self):
+        stack = self._makeOne(max_length=2)
+        for obj in range(5):
+            stack.push(obj)
+        self.assertEqual(stack._layerPosition(3), -1)
+        self.assertEqual(stack._layerPosition(2), 0)
+        self.assertEqual(stack._layerPosition(0), 2)
+        self.assertEqual(stack._layerPosition(-1), 3)
+
     def test_push_one(self):
         stack = self._makeOne()
         OBJ = object()
@@ -195,6 +389,20 @@ class AppendStackTests(unittest.TestCase):
         self.assertEqual(stack._layers[0]._generation, 1)
         self.assertEqual(stack._layers[1]._generation, 0)
 
+    def test_push_wo_rollover_keeps_layers_list(self):
+        stack = self._makeOne(max_layers=1)
+        layers = stack._layers
+        stack.push(object())
+        self.assertTrue(stack._layers is layers)
+
+    def test_push_materializes_unpickled_head(self):
+        stack = self._makeOne(max_length=2)
+        stack.__setstate__((10, 2, [(0, [0])]))
+        stack.push(1)
+        self.assertFalse(type(stack._layers[0]) is tuple)
+        stack.push(2)
+        self.assertEqual(list(stack), [(1, 0, 2), (0, 1, 1), (0, 0, 0)])
+
     def test_push_trimming_layers(self):
         stack = self._makeOne(max_layers=4)
         for obj in range(1001):
@@ -234,6 +442,65 @@ class AppendStackTests(unittest.TestCase):
         self.assertEqual(_pruned[5], list(range(500, 600)))
         self.assertEqual(_pruned[6], list(range(600, 700)))
 
+    def test_push_many_empty(self):
+        stack = self._makeOne()
+        stack.push_many([])
+        self.assertEqual(list(stack), [])
+        self.assertEqual(len(stack._layers), 1)
+
+    def test_push_many_fills_current_layer(self):
+        stack = self._makeOne(max_length=3)
+        stack.push(0)
+        stack.push_many(iter([1, 2]))
+        self.assertEqual(list(stack), [(0, 2, 2), (0, 1, 1), (0, 0, 0)])
+        self.assertEqual(len(stack._layers), 1)
+
+    def test_push_many_w_raising_iterable_leaves_head_unchanged(self):
+        stack = self._makeOne(max_length=3)
+        stack.push(0)
+        def _objs():
+            yield 1
+            raise ValueError()
+        self.assertRaises(ValueError, stack.push_many, _objs())
+        self.assertEqual(list(stack), [(0, 0, 0)])
+
+    def test_push_many_adds_layers(self):
+        stack = self._makeOne(max_length=3)
+        stack.push(0)
+        stack.push_many(range(1, 9))
+        self.assertEqual(stack.__getstate__(),
+                         (10, 3, [(2, [6, 7, 8]),
+                                  (1, [3, 4, 5]),
+                                  (0, [0, 1, 2]),
+                                 ]))
+
+    def test_push_many_matches_push(self):
+        pushed = self._makeOne(max_layers=4, max_length=7)
+        for obj in range(100):
+            pushed.push(obj)
+        bulk = self._makeOne(max_layers=4, max_length=7)
+        bulk.push_many(range(50))
+        bulk.push_many(range(50, 100))
+        self.assertEqual(bulk.__getstate__(), pushed.__getstate__())
+
+    def test_push_many_prunes_oldest_first(self):
+        _pruned = []
+        def _prune(generation, items):
+            _pruned.append((generation, items))
+        stack = self._makeOne(max_layers=2, max_length=2)
+        stack.push(0, pruner=_prune)
+        stack.push_many(range(1, 9), pruner=_prune)
+        self.assertEqual(_pruned, [(0, [0, 1]), (1, [2, 3]), (2, [4, 5])])
+        self.assertEqual(stack.__getstate__(),
+                         (2, 2, [(4, [8]), (3, [6, 7])]))
+
+    def test_push_many_w_archive_pruner(self):
+        from appendonly import Archive
+        archive = Archive()
+        stack = self._makeOne(max_layers=2, max_length=2)
+        stack.push_many(range(9), pruner=archive.addLayer)
+        self.assertEqual([x[2] for x in archive], [5, 4, 3, 2, 1, 0])
+
     def test___getstate___empty(self):
         stack = self._makeOne()
         self.assertEqual(stack.__getstate__(), (10, 100, [(0, [])]))
@@ -262,6 +529,46 @@ class AppendStackTests(unittest.TestCase):
                                        (2, 0, 6),
                                       ])
 
+    def test___setstate___adopts_lists(self):
+        stack = self._makeOne()
+        STATE = (2, 3, [(3, [9]), (2, [6, 7, 8])])
+        stack.__setstate__(STATE)
+        self.assertTrue(stack._getLayer(0)._stack is STATE[2][0][1])
+        self.assertTrue(stack._getLayer(1)._stack is STATE[2][1][1])
+
+    def test___setstate___defers_layers(self):
+        from appendonly import _Layer
+        stack = self._makeOne()
+        STATE = (10, 3, [(3, [9]), (2, [6, 7, 8]), (1, [3, 4, 5])])
+        stack.__setstate__(STATE)
+        self.assertEqual(stack._layers, STATE[2])
+        self.assertEqual(list(stack.newer(3, -1)), [(3, 0, 9)])
+        self.assertTrue(isinstance(stack._layers[0], _Layer))
+        self.assertEqual(stack._layers[1:], STATE[2][1:])
+        self.assertEqual(stack[(1, 1)], 4)
+        self.assertTrue(isinstance(stack._layers[2], _Layer))
+        self.assertEqual(stack._layers[1], STATE[2][1])
+
+    def test___getstate___w_deferred_layers(self):
+        stack = self._makeOne()
+        STATE = (10, 3, [(3, [9]), (2, [6, 7, 8])])
+        stack.__setstate__(STATE)
+        stack.push(10)
+        self.assertEqual(stack.__getstate__(),
+                         (10, 3, [(3, [9, 10]), (2, [6, 7, 8])]))
+        self.assertEqual(stack._layers[1], STATE[2][1])
+
+    def test_push_prunes_deferred_layers(self):
+        _pruned = []
+        def _prune(generation, items):
+            _pruned.append((generation, items))
+        stack = self._makeOne()
+        stack.__setstate__((2, 3, [(3, [9, 10, 11]), (2, [6, 7, 8])]))
+        stack.push(12, _prune)
+        self.assertEqual(_pruned, [(2, [6, 7, 8])])
+        self.assertEqual(stack.__getstate__(),
+                         (2, 3, [(4, [12]), (3, [9, 10, 11])]))
+
     def test__p_resolveConflict_mismatched_max_layers(self):
         from appendonly import ConflictError
         O_STATE = (2,                 # _max_layers
@@ -286,6 +593,15 @@ class AppendStackTests(unittest.TestCase):
         self.assertRaises(ConflictError, stack._p_resolveConflict,
                           O_STATE, C_STATE, N_STATE)
 
+    def test__p_resolveConflict_mismatched_committed_max_layers(self):
+        from appendonly import ConflictError
+        O_STATE = (2, 3, [(3, [9]), (2, [6, 7, 8])])
+        C_STATE = (3, 3, [(3, [9]), (2, [6, 7, 8])])
+        N_STATE = (2, 3, [(3, [9]), (2, [6, 7, 8])])
+        stack = self._makeOne()
+        self.assertRaises(ConflictError, stack._p_resolveConflict,
+                          O_STATE, C_STATE, N_STATE)
+
     def test__p_resolveConflict_mismatched_max_length(self):
         from appendonly import ConflictError
         O_STATE = (2,                 # _max_layers
@@ -311,7 +627,6 @@ class AppendStackTests(unittest.TestCase):
                           O_STATE, C_STATE, N_STATE)
 
     def test__p_resolveConflict_old_latest_commited_earliest(self):
-        from appendonly import ConflictError
         O_STATE = (2,                 # _max_layers
                    3,                 # _max_length
                    [(3, [9]),        # _layers[0] as (generation, list)
@@ -330,9 +645,15 @@ class AppendStackTests(unittest.TestCase):
                     (2, [6, 7, 8]),  # _layers[1] as (generation, list)
                    ],
                 )
+        M_STATE = (2,                 # _max_layers
+                   3,                 # _max_length
+                   [(5, [29, 10]),    # _layers[0] as (generation, list)
+                    (4, [26, 27, 28]),  # _layers[1] as (generation, list)
+                   ],
+                )
         stack = self._makeOne()
-        self.assertRaises(ConflictError, stack._p_resolveConflict,
-                          O_STATE, C_STATE, N_STATE)
+        merged = stack._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(merged, M_STATE)
 
     def test__p_resolveConflict_old_latest_new_earliest(self):
         from appendonly import ConflictError
@@ -358,6 +679,104 @@ class AppendStackTests(unittest.TestCase):
         self.assertRaises(ConflictError, stack._p_resolveConflict,
                           O_STATE, C_STATE, N_STATE)
 
+    def test__p_resolveConflict_new_rolled_past_full_old_latest(self):
+        O_STATE = (2, 3, [(3, [9, 10, 11]), (2, [6, 7, 8])])
+        C_STATE = (2, 3, [(4, [20]), (3, [9, 10, 11])])
+        N_STATE = (2, 3, [(5, [15]), (4, [12, 13, 14])])
+        stack = self._makeOne()
+        merged = stack._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(merged,
+                         (2, 3, [(5, [14, 15]), (4, [20, 12, 13])]))
+
+    def test__p_resolveConflict_new_rolled_past_full_old_latest_w_gap(self):
+        from appendonly import ConflictError
+        O_STATE = (2, 3, [(3, [9, 10, 11]), (2, [6, 7, 8])])
+        C_STATE = (2, 3, [(4, [20]), (3, [9, 10, 11])])
+        N_STATE = (2, 3, [(6, [18]), (5, [15, 16, 17])])
+        stack = self._makeOne()
+        self.assertRaises(ConflictError, stack._p_resolveConflict,
+                          O_STATE, C_STATE, N_STATE)
+
+    def test__p_resolveConflict_both_rolled_past_old(self):
+        # Committed's layer 4, which no pruner has seen, is kept past
+        # 'max_layers'.
+        old = self._makeOne(max_layers=2, max_length=3)
+        old.push_many(range(9))
+        committed = self._makeOne(max_layers=2, max_length=3)
+        committed.push_many(range(9))
+        committed.push_many(['c%d' % x for x in range(7)])
+        new = self._makeOne(max_layers=2, max_length=3)
+        new.push_many(range(9))
+        new.push_many(['n%d' % x for x in range(4)])
+        merged = old._p_resolveConflict(old.__getstate__(),
+                                        committed.__getstate__(),
+                                        new.__getstate__())
+        self.assertEqual(merged,
+                         (2, 3, [(6, ['n2', 'n3']),
+                                 (5, ['c6', 'n0', 'n1']),
+                                 (4, ['c3', 'c4', 'c5']),
+                                ]))
+
+    def test__p_resolveConflict_both_rolled_to_same_generation(self):
+        old = self._makeOne(max_layers=4, max_length=4)
+        old.push_many(range(15))
+        committed = self._makeOne(max_layers=4, max_length=4)
+        committed.push_many(range(15))
+        committed.push_many(['c0', 'c1', 'c2', 'c3'])
+        new = self._makeOne(max_layers=4, max_length=4)
+        new.push_many(range(15))
+        new.push_many(['n0', 'n1'])
+        merged = old._p_resolveConflict(old.__getstate__(),
+                                        committed.__getstate__(),
+                                        new.__getstate__())
+        self.assertEqual(merged,
+                         (4, 4, [(5, ['n1']),
+                                 (4, ['c1', 'c2', 'c3', 'n0']),
+                                 (3, [12, 13, 14, 'c0']),
+                                 (2, [8, 9, 10, 11]),
+                                 (1, [4, 5, 6, 7]),
+                                ]))
+        # The next push which adds a layer prunes the extra layers.
+        stack = self._makeOne()
+        stack.__setstate__(merged)
+        pruned = []
+        stack.push_many(['x0', 'x1', 'x2', 'x3'],
+                        lambda gen, items: pruned.append(gen))
+        self.assertEqual(pruned, [1, 2])
+        self.assertEqual([x[0] for x in stack.__getstate__()[2]],
+                         [6, 5, 4, 3])
+
+    def test__p_resolveConflict_new_rolled_past_old_c_appended(self):
+        # New handed layers 1 and 2 to its pruner:  they may be dropped.
+        old = self._makeOne(max_layers=3, max_length=3)
+        old.push_many(range(10))
+        committed = self._makeOne(max_layers=3, max_length=3)
+        committed.push_many(range(10))
+        committed.push('c0')
+        new = self._makeOne(max_layers=3, max_length=3)
+        new.push_many(range(10))
+        new.push_many(['n%d' % x for x in range(6)])
+        expected = self._makeOne(max_layers=3, max_length=3)
+        expected.push_many(range(10))
+        expected.push('c0')
+        expected.push_many(['n%d' % x for x in range(6)])
+        merged = old._p_resolveConflict(old.__getstate__(),
+                                        committed.__getstate__(),
+                                        new.__getstate__())
+        self.assertEqual(merged, expected.__getstate__())
+
+    def test__p_resolveConflict_keeps_committed_layer(self):
+        O_STATE = (2, 3, [(0, [])])
+        C_STATE = (2, 3, [(0, ['c0', 'c1', 'c2'])])
+        N_STATE = (2, 3, [(1, ['n3']), (0, ['n0', 'n1', 'n2'])])
+        stack = self._makeOne()
+        merged = stack._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(merged,
+                         (2, 3, [(2, ['n3']),
+                                 (1, ['n0', 'n1', 'n2']),
+                                 (0, ['c0', 'c1', 'c2']),
+                                ]))
+
     def test__p_resolveConflict_no_added_layers(self):
         O_STATE = (2,                 # _max_layers
                    3,                 # _max_length
@@ -445,6 +864,583 @@ class AppendStackTests(unittest.TestCase):
         merged = stack._p_resolveConflict(O_STATE, C_STATE, N_STATE)
         self.assertEqual(merged, M_STATE)
 
+    def test__p_resolveConflict_shares_untouched_layers(self):
+        O_STATE = (3, 3, [(3, [9]), (2, [6, 7, 8])])
+        C_STATE = (3, 3, [(3, [9, 10, 11]), (2, [6, 7, 8])])
+        N_STATE = (3, 3, [(3, [9, 12]), (2, [6, 7, 8])])
+        stack = self._makeOne()
+        merged = stack._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(merged,
+                         (3, 3, [(4, [12]), (3, [9, 10, 11]), (2, [6, 7, 8])]))
+        self.assertTrue(merged[2][1] is C_STATE[2][0])
+        self.assertTrue(merged[2][2] is C_STATE[2][1])
+
+    def test__p_resolveConflict_drops_layer_info(self):
+        O_STATE = (2, 3, [(3, [9]), (2, [6, 7, 8])], None, {2: (3, 8)})
+        C_STATE = (2, 3, [(3, [9, 10]), (2, [6, 7, 8])], None, {2: (3, 8)})
+        N_STATE = (2, 3, [(3, [9, 11]), (2, [6, 7, 8])], None, {2: (3, 8)})
+        stack = self._makeOne()
+        merged = stack._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(merged, (2, 3, [(3, [9, 10, 11]), (2, [6, 7, 8])]))
+
+    def test___getstate___w_layer_info(self):
+        stack = self._makeOne(max_length=2)
+        stack.push_many(range(3))
+        stack._layer_info = {0: (10, None)}
+        state = stack.__getstate__()
+        self.assertEqual(state[3:], (None, {0: (10, None)}))
+        other = self._makeOne()
+        other.__setstate__(state)
+        self.assertEqual(other._layer_info, {0: (10, None)})
+        self.assertEqual(other._typecode, None)
+        self.assertEqual(list(other), list(stack))
+
+    def test__p_resolveConflict_many_new_items(self):
+        old = self._makeOne(max_layers=100, max_length=10)
+        old.push_many(range(15))
+        committed = self._makeOne(max_layers=100, max_length=10)
+        committed.push_many(range(15))
+        committed.push_many(['c%d' % x for x in range(7)])
+        new = self._makeOne(max_layers=100, max_length=10)
+        new.push_many(range(15))
+        new.push_many(['n%d' % x for x in range(500)])
+        expected = self._makeOne(max_layers=100, max_length=10)
+        expected.push_many(range(15))
+        expected.push_many(['c%d' % x for x in range(7)])
+        expected.push_many(['n%d' % x for x in range(500)])
+        merged = old._p_resolveConflict(old.__getstate__(),
+                                        committed.__getstate__(),
+                                        new.__getstate__())
+        self.assertEqual(merged, expected.__getstate__())
+
+
+class CursorTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from appendonly import Cursor
+        return Cursor
+
+    def _makeOne(self, generation=3, index=7):
+        return self._getTargetClass()(generation, index)
+
+    def test_is_tuple(self):
+        cursor = self._makeOne()
+        self.assertEqual(cursor, (3, 7))
+        self.assertEqual(cursor.generation, 3)
+        self.assertEqual(cursor.index, 7)
+
+    def test_token_roundtrip(self):
+        klass = self._getTargetClass()
+        cursor = self._makeOne()
+        self.assertEqual(cursor.token(), '3:7')
+        self.assertEqual(klass.fromToken(cursor.token()), cursor)
+        self.assertEqual(klass.fromToken('-1:-1'), (-1, -1))
+
+    def test_fromToken_invalid(self):
+        klass = self._getTargetClass()
+        self.assertRaises(ValueError, klass.fromToken, 'bogus')
+        self.assertRaises(ValueError, klass.fromToken, '1:x')
+        self.assertRaises(ValueError, klass.fromToken, None)
+
+
+class RetentionTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from appendonly import Retention
+        return Retention
+
+    def _makeOne(self, *args, **kw):
+        return self._getTargetClass()(*args, **kw)
+
+    def _makeStack(self, max_layers=10, max_length=2):
+        from appendonly import AppendStack
+        return AppendStack(max_layers, max_length)
+
+    def _pruned(self):
+        pruned = []
+        def _pruner(generation, items):
+            pruned.append((generation, list(items)))
+        return pruned, _pruner
+
+    def test_ctor_max_age_wo_timestamp(self):
+        self.assertRaises(ValueError, self._makeOne, max_age=10)
+
+    def test_push_w_max_age(self):
+        now = [100]
+        retention = self._makeOne(max_age=10, timestamp=lambda x: x,
+                                  clock=lambda: now[0])
+        stack = self._makeStack()
+        pruned, pruner = self._pruned()
+        stack.push_many([90, 91, 92, 93, 94], pruner, retention)
+        self.assertEqual(pruned, [])
+        now[0] = 102
+        stack.push(95, pruner, retention) # fills head:  no rollover
+        self.assertEqual(pruned, [(0, [90, 91])])
+        self.assertEqual([x[2] for x in stack], [95, 94, 93, 92])
+
+    def test_push_w_max_age_keeps_head(self):
+        retention = self._makeOne(max_age=10, timestamp=lambda x: x,
+                                  clock=lambda: 1000)
+        stack = self._makeStack()
+        pruned, pruner = self._pruned()
+        stack.push_many([1, 2, 3], pruner, retention)
+        self.assertEqual(pruned, [(0, [1, 2])])
+        self.assertEqual(list(stack), [(1, 0, 3)])
+
+    def test_push_many_w_max_bytes(self):
+        retention = self._makeOne(max_bytes=5, sizer=len)
+        stack = self._makeStack()
+        pruned, pruner = self._pruned()
+        stack.push_many(range(7), pruner, retention)
+        self.assertEqual(pruned, [(0, [0, 1])])
+        self.assertEqual([x[2] for x in stack], [6, 5, 4, 3, 2])
+
+    def test_push_w_max_bytes_checked_on_rollover(self):
+        retention = self._makeOne(max_bytes=3, sizer=len)
+        stack = self._makeStack()
+        pruned, pruner = self._pruned()
+        stack.push_many(range(3), pruner, retention)
+        self.assertEqual(pruned, [])
+        stack.push(3, pruner, retention) # fills head:  no rollover
+        self.assertEqual(pruned, [])
+        stack.push(4, pruner, retention)
+        self.assertEqual(pruned, [(0, [0, 1])])
+        self.assertEqual([x[2] for x in stack], [4, 3, 2])
+
+    def test_push_w_max_bytes_keeps_head(self):
+        retention = self._makeOne(max_bytes=1, sizer=len)
+        stack = self._makeStack()
+        stack.push_many(range(5), retention=retention)
+        self.assertEqual(list(stack), [(2, 0, 4)])
+
+    def test_push_w_max_layers_and_retention(self):
+        retention = self._makeOne(max_bytes=100, sizer=len)
+        stack = self._makeStack(max_layers=2)
+        pruned, pruner = self._pruned()
+        stack.push_many(range(6), pruner, retention)
+        self.assertEqual(pruned, [(0, [0, 1])])
+
+    def test_push_w_max_age_doesnt_load_oldest_layer(self):
+        now = [100]
+        retention = self._makeOne(max_age=10, timestamp=lambda x: x,
+                                  clock=lambda: now[0])
+        stack = self._makeStack()
+        stack.push_many([90, 91, 92, 93, 94], retention=retention)
+        self.assertEqual(stack._layer_info, {0: (None, 91)})
+        stack.__setstate__(stack.__getstate__())
+        stack.push(95, retention=retention)
+        self.assertTrue(type(stack._layers[-1]) is tuple)
+        now[0] = 102
+        stack.push(96, retention=retention) # prunes generation 0
+        self.assertEqual(stack._layer_info, {1: (None, 93)})
+        stack.__setstate__(stack.__getstate__())
+        stack.push(97, retention=retention)
+        self.assertEqual([x._generation for x in stack._layers[:1]], [3])
+        self.assertTrue(type(stack._layers[-1]) is tuple)
+
+    def test_push_w_max_bytes_measures_each_layer_once(self):
+        measured = []
+        def _sizer(items):
+            measured.append(list(items))
+            return len(items)
+        retention = self._makeOne(max_bytes=100, sizer=_sizer)
+        stack = self._makeStack()
+        for obj in range(7):
+            stack.push(obj, retention=retention)
+        # Full layers are measured once;  the head on each rollover.
+        self.assertEqual(measured, [[2], [0, 1], [4], [2, 3], [6], [4, 5]])
+        self.assertEqual(stack._layer_info,
+                         {0: (2, None), 1: (2, None), 2: (2, None)})
+
+    def test_layer_info_w_other_retention(self):
+        retention = self._makeOne(max_bytes=100, sizer=len)
+        stack = self._makeStack()
+        stack.push_many(range(5), retention=retention)
+        other = self._makeOne(max_age=10, timestamp=lambda x: x,
+                              clock=lambda: 0)
+        self.assertEqual(stack._layerInfo(2, other), (2, 1))
+        self.assertEqual(stack._layer_info[0], (2, 1))
+
+    def test_default_sizer(self):
+        import pickle
+        retention = self._makeOne(max_bytes=100)
+        items = list(range(10))
+        self.assertEqual(retention.sizer(items),
+                         len(pickle.dumps(items, 2)))
+
+
+class TypedAppendStackTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from appendonly import AppendStack
+        return AppendStack
+
+    def _makeOne(self, max_layers=10, max_length=100, typecode='l'):
+        return self._getTargetClass()(max_layers, max_length,
+                                      typecode=typecode)
+
+    def test_ctor(self):
+        from array import array
+        stack = self._makeOne()
+        self.assertEqual(stack._typecode, 'l')
+        self.assertTrue(isinstance(stack._layers[0]._stack, array))
+
+    def test_push_and_iter(self):
+        from array import array
+        stack = self._makeOne(max_length=2)
+        for obj in range(5):
+            stack.push(obj)
+        stack.push_many(range(5, 8))
+        self.assertEqual([x[2] for x in stack], list(reversed(range(8))))
+        for layer in stack._layers:
+            self.assertTrue(isinstance(layer._stack, array))
+
+    def test_push_wrong_type(self):
+        stack = self._makeOne()
+        self.assertRaises(TypeError, stack.push, 'abc')
+
+    def test_push_many_wrong_type_changes_nothing(self):
+        stack = self._makeOne(max_length=3)
+        stack.push_many([0, 1])
+        before = list(stack)
+        self.assertRaises(TypeError, stack.push_many, [2, 3, 4, 'abc', 5])
+        self.assertEqual(list(stack), before)
+        self.assertEqual(len(stack._layers), 1)
+
+    def test_typecode_fallback(self):
+        # E.g., Python 2.7, which lacks 'q', on a platform with 64-bit 'l'.
+        import appendonly
+        saved = appendonly._TYPECODES
+        appendonly._TYPECODES = {'q': 'l'}
+        try:
+            stack = self._makeOne(max_length=2, typecode='q')
+            stack.push_many(range(5))
+            self.assertEqual(stack._layers[0]._stack.typecode, 'l')
+            state = stack.__getstate__()
+            self.assertEqual(state[3], 'q')
+            copy = self._getTargetClass()()
+            copy.__setstate__(state)
+            self.assertEqual(list(copy), list(stack))
+        finally:
+            appendonly._TYPECODES = saved
+
+    def test___getstate__(self):
+        from array import array
+        stack = self._makeOne(2, 3)
+        stack.push_many(range(10))
+        max_layers, max_length, layers, typecode = stack.__getstate__()
+        self.assertEqual((max_layers, max_length, typecode), (2, 3, 'l'))
+        self.assertEqual([x[0] for x in layers], [3, 2])
+        self.assertEqual(layers[1][1], array('l', [6, 7, 8]).tobytes())
+
+    def test___setstate__roundtrip(self):
+        stack = self._makeOne(2, 3)
+        stack.push_many(range(10))
+        copy = self._getTargetClass()()
+        copy.__setstate__(stack.__getstate__())
+        self.assertEqual(copy._typecode, 'l')
+        self.assertEqual(list(copy), list(stack))
+        copy.push(10)
+        self.assertEqual(copy[(3, 1)], 10)
+
+    def test___setstate___decodes_layers_lazily(self):
+        from array import array
+        stack = self._makeOne(10, 3)
+        stack.push_many(range(8))
+        state = stack.__getstate__()
+        copy = self._getTargetClass()()
+        copy.__setstate__(state)
+        self.assertEqual(list(copy.newer(2, 0)), [(2, 1, 7)])
+        self.assertTrue(isinstance(copy._layers[0]._stack, array))
+        self.assertEqual(copy._layers[1:], state[2][1:])
+        self.assertEqual(copy.__getstate__(), state)
+
+    def test_pickle_roundtrip(self):
+        import pickle
+        stack = self._makeOne(2, 3)
+        stack.push_many(range(10))
+        copy = pickle.loads(pickle.dumps(stack))
+        self.assertEqual(list(copy), list(stack))
+
+    def test_newer_slices(self):
+        from array import array
+        stack = self._makeOne(max_length=3)
+        stack.push_many(range(8))
+        slices = list(stack.newer_slices(0, 1))
+        self.assertEqual([(g, f, list(x)) for g, f, x in slices],
+                         [(2, 0, [6, 7]), (1, 0, [3, 4, 5]), (0, 2, [2])])
+        self.assertTrue(isinstance(slices[0][2], array))
+        self.assertTrue(isinstance(slices[1][2], memoryview))
+        # Outstanding views of full layers must not block pushes.
+        stack.push(8)
+        self.assertEqual(slices[1][2].obj, stack._layers[1]._stack)
+
+    def test_newer_slices_untyped(self):
+        stack = self._makeOne(max_length=3, typecode=None)
+        stack.push_many(range(5))
+        self.assertEqual(list(stack.newer_slices()),
+                         [(1, 0, [3, 4]), (0, 0, [0, 1, 2])])
+        self.assertEqual(list(stack.newer_slices(1, 1)), [])
+
+    def test__p_resolveConflict(self):
+        def _state(*pushes):
+            stack = self._makeOne(10, 3)
+            for objs in pushes:
+                stack.push_many(objs)
+            return stack.__getstate__()
+        merged = self._makeOne()._p_resolveConflict(
+            _state([0, 1]), _state([0, 1], [2, 3]), _state([0, 1], [4]))
+        self.assertEqual(merged, _state([0, 1, 2, 3, 4]))
+
+    def test__p_resolveConflict_mismatched_typecode(self):
+        from appendonly import ConflictError
+        O_STATE = (2, 3, [(0, [])])
+        C_STATE = (2, 3, [(0, [])])
+        N_STATE = (2, 3, [(0, b'')], 'l')
+        stack = self._makeOne()
+        self.assertRaises(ConflictError, stack._p_resolveConflict,
+                          O_STATE, C_STATE, N_STATE)
+
+
+class _DBTestBase(object):
+
+    def setUp(self):
+        import tempfile
+        self._tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        for db in getattr(self, '_dbs', ()):
+            db.close()
+        shutil.rmtree(self._tmpdir)
+
+    def _makeDB(self):
+        import os
+        from ZODB.DB import DB
+        from ZODB.FileStorage import FileStorage
+        storage = FileStorage(os.path.join(self._tmpdir, 'Data.fs'))
+        db = DB(storage)
+        self._dbs = getattr(self, '_dbs', []) + [db]
+        return db
+
+    def _open(self, db):
+        import transaction
+        tm = transaction.TransactionManager()
+        return tm, db.open(transaction_manager=tm)
+
+
+class BucketLayerTests(unittest.TestCase, _LayerTestBase):
+
+    def _getTargetClass(self):
+        from appendonly import _BucketLayer
+        return _BucketLayer
+
+    def test_is_persistent(self):
+        from persistent import Persistent
+        self.assertTrue(issubclass(self._getTargetClass(), Persistent))
+
+    def test_push(self):
+        layer = self._makeOne()
+        OBJ1, OBJ2 = object(), object()
+        layer.push(OBJ1)
+        layer.push(OBJ2)
+        self.assertEqual(list(layer), [(1, OBJ2), (0, OBJ1)])
+
+    def test__p_resolveConflict_both_append(self):
+        O_STATE = {'_generation': 3, '_max_length': 4, '_stack': [1]}
+        C_STATE = {'_generation': 3, '_max_length': 4, '_stack': [1, 2]}
+        N_STATE = {'_generation': 3, '_max_length': 4, '_stack': [1, 3, 4]}
+        layer = self._makeOne()
+        resolved = layer._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(resolved,
+                         {'_generation': 3, '_max_length': 4,
+                          '_stack': [1, 2, 3, 4]})
+
+    def test__p_resolveConflict_overfills(self):
+        O_STATE = {'_generation': 3, '_max_length': 2, '_stack': [1]}
+        C_STATE = {'_generation': 3, '_max_length': 2, '_stack': [1, 2]}
+        N_STATE = {'_generation': 3, '_max_length': 2, '_stack': [1, 3]}
+        layer = self._makeOne()
+        resolved = layer._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(resolved['_stack'], [1, 2, 3])
+
+    def test__p_resolveConflict_mismatched_generation(self):
+        from appendonly import ConflictError
+        O_STATE = {'_generation': 3, '_max_length': 4, '_stack': [1]}
+        C_STATE = {'_generation': 3, '_max_length': 4, '_stack': [1, 2]}
+        N_STATE = {'_generation': 4, '_max_length': 4, '_stack': [3]}
+        layer = self._makeOne()
+        self.assertRaises(ConflictError, layer._p_resolveConflict,
+                          O_STATE, C_STATE, N_STATE)
+
+
+class BucketedAppendStackTests(_DBTestBase, unittest.TestCase):
+
+    def _getTargetClass(self):
+        from appendonly import BucketedAppendStack
+        return BucketedAppendStack
+
+    def _makeOne(self, *args, **kw):
+        return self._getTargetClass()(*args, **kw)
+
+    def test_instance_conforms_to_IAppendStack(self):
+        from zope.interface.verify import verifyObject
+        from appendonly.interfaces import IAppendStack
+        verifyObject(IAppendStack, self._makeOne())
+
+    def test_layers_are_persistent(self):
+        from appendonly import _BucketLayer
+        stack = self._makeOne(max_length=2)
+        stack.push_many(range(5))
+        self.assertEqual(len(stack._layers), 3)
+        for layer in stack._layers:
+            self.assertTrue(isinstance(layer, _BucketLayer))
+        self.assertEqual([x[2] for x in stack], [4, 3, 2, 1, 0])
+
+    def test___getstate___holds_layers(self):
+        stack = self._makeOne(2, 3)
+        stack.push(1)
+        state = stack.__getstate__()
+        self.assertEqual(state, (2, 3, stack._layers))
+        self.assertFalse(state[2] is stack._layers)
+
+    def test_newer_and_pruning(self):
+        _pruned = []
+        def _prune(generation, items):
+            _pruned.append((generation, items))
+        stack = self._makeOne(max_layers=2, max_length=2)
+        for obj in range(7):
+            stack.push(obj, pruner=_prune)
+        self.assertEqual(_pruned, [(0, [0, 1]), (1, [2, 3])])
+        self.assertEqual(list(stack.newer(2, 0)), [(3, 0, 6), (2, 1, 5)])
+        self.assertEqual(list(stack.newer(0, 0)),
+                         [(3, 0, 6), (2, 1, 5), (2, 0, 4)])
+        self.assertEqual(list(stack.newer(4, 0)), [])
+
+    def test_push_writes_only_head_layer(self):
+        db = self._makeDB()
+        tm, conn = self._open(db)
+        stack = conn.root()['stack'] = self._makeOne(max_length=3)
+        stack.push_many(range(4))
+        tm.commit()
+        stack.push(4)
+        self.assertFalse(stack._p_changed)
+        self.assertTrue(stack._layers[0]._p_changed)
+        self.assertFalse(stack._layers[1]._p_changed)
+        tm.commit()
+
+    def test_concurrent_pushes_resolve(self):
+        db = self._makeDB()
+        tm1, conn1 = self._open(db)
+        conn1.root()['stack'] = self._makeOne(max_length=10)
+        tm1.commit()
+        tm2, conn2 = self._open(db)
+        conn1.root()['stack'].push('a')
+        conn2.root()['stack'].push('b')
+        tm1.commit()
+        tm2.commit()
+        tm3, conn3 = self._open(db)
+        self.assertEqual([x[2] for x in conn3.root()['stack']], ['b', 'a'])
+
+    def test_concurrent_rollovers_conflict(self):
+        from ZODB.POSException import ConflictError
+        db = self._makeDB()
+        tm1, conn1 = self._open(db)
+        conn1.root()['stack'] = self._makeOne(max_length=1)
+        conn1.root()['stack'].push('x')
+        tm1.commit()
+        tm2, conn2 = self._open(db)
+        conn1.root()['stack'].push('a')
+        conn2.root()['stack'].push('b')
+        tm1.commit()
+        self.assertRaises(ConflictError, tm2.commit)
+        tm2.abort()
+
+
+class MergeNewerTests(unittest.TestCase):
+
+    def _callFUT(self, *args, **kw):
+        from appendonly import merge_newer
+        return merge_newer(*args, **kw)
+
+    def _makeStack(self, items, max_length=2):
+        from appendonly import AppendStack
+        stack = AppendStack(max_length=max_length)
+        stack.push_many(items)
+        return stack
+
+    def test_wo_stacks(self):
+        self.assertEqual(list(self._callFUT([])), [])
+
+    def test_empty_stacks(self):
+        stacks = [self._makeStack([]), self._makeStack([])]
+        self.assertEqual(list(self._callFUT(stacks)), [])
+
+    def test_w_history(self):
+        from appendonly import AppendStack
+        from appendonly import Archive
+        from appendonly import History
+        stack = AppendStack(max_layers=1, max_length=2)
+        archive = Archive()
+        stack.push_many('abcde', archive.addLayer)
+        history = History(stack, archive)
+        stacks = [history, self._makeStack('xy')]
+        self.assertEqual(list(self._callFUT(stacks, cursors=[(0, 1), None])),
+                         [(0, 2, 0, 'e'),
+                          (0, 1, 1, 'd'),
+                          (0, 1, 0, 'c'),
+                          (1, 0, 1, 'y'),
+                          (1, 0, 0, 'x'),
+                         ])
+
+    def test_merges_by_key(self):
+        stacks = [self._makeStack('abc'), self._makeStack('defgh')]
+        self.assertEqual(list(self._callFUT(stacks)),
+                         [(1, 2, 0, 'h'),
+                          (1, 1, 1, 'g'),
+                          (0, 1, 0, 'c'),
+                          (1, 1, 0, 'f'),
+                          (0, 0, 1, 'b'),
+                          (1, 0, 1, 'e'),
+                          (0, 0, 0, 'a'),
+                          (1, 0, 0, 'd'),
+                         ])
+
+    def test_w_cursors(self):
+        stacks = [self._makeStack('abc'), self._makeStack('defgh')]
+        merged = self._callFUT(stacks, cursors=[None, (1, 0)])
+        self.assertEqual([x[3] for x in merged], ['h', 'g', 'c', 'b', 'a'])
+
+    def test_w_limit(self):
+        stacks = [self._makeStack('abc'), self._makeStack('defgh')]
+        merged = self._callFUT(stacks, limit=3)
+        self.assertEqual([x[3] for x in merged], ['h', 'g', 'c'])
+
+    def test_w_limit_zero(self):
+        stacks = [self._makeStack('abc')]
+        self.assertEqual(list(self._callFUT(stacks, limit=0)), [])
+
+    def test_w_key(self):
+        stacks = [self._makeStack([1, 4, 5]), self._makeStack([2, 3, 6])]
+        merged = self._callFUT(stacks, key=lambda x: x)
+        self.assertEqual([(x[0], x[3]) for x in merged],
+                         [(1, 6), (0, 5), (0, 4), (1, 3), (1, 2), (0, 1)])
+
+    def test_reads_lazily(self):
+        read = []
+        class _Stack(object):
+            _p_jar = None
+            def __init__(self, name, count):
+                self.name, self.count = name, count
+            def __iter__(self):
+                for index in range(self.count - 1, -1, -1):
+                    read.append(self.name)
+                    yield 0, index, self.name
+        stacks = [_Stack('a', 100), _Stack('b', 1)]
+        merged = self._callFUT(stacks, limit=3)
+        self.assertEqual([x[3] for x in merged], ['a', 'a', 'a'])
+        self.assertEqual(read, ['a', 'b', 'a', 'a'])
+
 
 class ArchiveLayerTests(unittest.TestCase, _LayerTestBase):
 
@@ -462,7 +1458,7 @@ class ArchiveLayerTests(unittest.TestCase, _LayerTestBase):
         source = _Layer(max_length=42, generation=13)
         for i in range(25):
             obj = object()
-            source.push(obj)
+            source._stack.append(obj)
         copied = klass.fromLayer(source)
         self.assertEqual(copied._max_length, 42)
         self.assertEqual(copied._generation, 13)
@@ -470,6 +1466,16 @@ class ArchiveLayerTests(unittest.TestCase, _LayerTestBase):
         for s_obj, c_obj in zip(source._stack, copied._stack):
             self.assertTrue(s_obj is c_obj)
 
+    def test_fromLayer_w_adopt(self):
+        from appendonly import _Layer
+        klass = self._getTargetClass()
+        source = _Layer(max_length=42, generation=13)
+        source._stack.append(object())
+        adopted = klass.fromLayer(source, adopt=True)
+        self.assertEqual(adopted._max_length, 42)
+        self.assertEqual(adopted._generation, 13)
+        self.assertTrue(adopted._stack is source._stack)
+
     def test___iter___filled(self):
         from appendonly import _Layer
         klass = self._getTargetClass()
@@ -477,9 +1483,9 @@ class ArchiveLayerTests(unittest.TestCase, _LayerTestBase):
         OBJ1 = object()
         OBJ2 = object()
         OBJ3 = object()
-        source.push(OBJ1)
-        source.push(OBJ2)
-        source.push(OBJ3)
+        source._stack.append(OBJ1)
+        source._stack.append(OBJ2)
+        source._stack.append(OBJ3)
         copied = klass.fromLayer(source)
         self.assertEqual(list(copied), [(2, OBJ3), (1, OBJ2), (0, OBJ1)])
 
@@ -487,7 +1493,7 @@ class ArchiveLayerTests(unittest.TestCase, _LayerTestBase):
         from appendonly import _Layer
         klass = self._getTargetClass()
         source = _Layer()
-        source.push(object())
+        source._stack.append(object())
         copied = klass.fromLayer(source)
         self.assertEqual(list(copied.newer(0)), [])
 
@@ -498,14 +1504,66 @@ class ArchiveLayerTests(unittest.TestCase, _LayerTestBase):
         OBJ1 = object()
         OBJ2 = object()
         OBJ3 = object()
-        source.push(OBJ1)
-        source.push(OBJ2)
-        source.push(OBJ3)
+        source._stack.append(OBJ1)
+        source._stack.append(OBJ2)
+        source._stack.append(OBJ3)
         copied = klass.fromLayer(source)
         self.assertEqual(list(copied.newer(0)),
                          [(2, OBJ3), (1, OBJ2)])
 
 
+class ArchiveSegmentTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from appendonly import _ArchiveSegment
+        return _ArchiveSegment
+
+    def _makeOne(self, generations=(2, 3, 5)):
+        from appendonly import _ArchiveLayer
+        layers = [_ArchiveLayer(generation=x, items=[x * 10, x * 10 + 1])
+                  for x in generations]
+        return self._getTargetClass()(layers)
+
+    def test_is_persistent(self):
+        from persistent import Persistent
+        self.assertTrue(issubclass(self._getTargetClass(), Persistent))
+
+    def test_ctor(self):
+        segment = self._makeOne()
+        self.assertEqual(segment._generation, 5)
+        self.assertEqual(segment._archivedGenerations(), [2, 3, 5])
+        self.assertEqual(segment._stacks, [[20, 21], [30, 31], [50, 51]])
+        self.assertEqual(segment._next, None)
+
+    def test__archivedLayer_hit(self):
+        segment = self._makeOne()
+        layer = segment._archivedLayer(3)
+        self.assertEqual(layer._generation, 3)
+        self.assertTrue(layer._stack is segment._stacks[1])
+
+    def test__archivedLayer_miss(self):
+        segment = self._makeOne()
+        self.assertEqual(segment._archivedLayer(4), None)
+        self.assertEqual(segment._archivedLayer(1), None)
+        self.assertEqual(segment._archivedLayer(6), None)
+
+    def test__archivedLayers(self):
+        segment = self._makeOne()
+        found = [x._generation for x in segment._archivedLayers()]
+        self.assertEqual(found, [2, 3, 5])
+        found = [x._generation for x in segment._archivedLayers(reverse=True)]
+        self.assertEqual(found, [5, 3, 2])
+
+    def test__archivedLayers_bounded(self):
+        segment = self._makeOne()
+        found = [x._generation for x in segment._archivedLayers(3, 4)]
+        self.assertEqual(found, [3])
+        found = [x._generation for x in segment._archivedLayers(3, None,
+                                                                 True)]
+        self.assertEqual(found, [5, 3])
+        self.assertEqual(list(segment._archivedLayers(6, None)), [])
+
+
 class ArchiveTests(unittest.TestCase):
 
     def _getTargetClass(self):
@@ -547,11 +1605,174 @@ class ArchiveTests(unittest.TestCase):
         self.assertEqual(gen_ndx, [(1, 1), (1, 0), (0, 2), (0, 1), (0, 0)])
         self.assertEqual(found, list(reversed(created)))
 
+    def _makeFilled(self, sizes=(3, 2, 3)):
+        archive = self._makeOne()
+        value = 0
+        for generation, size in enumerate(sizes):
+            archive.addLayer(generation, list(range(value, value + size)))
+            value += size
+        return archive
+
+    def test___getitem___hit(self):
+        archive = self._makeFilled()
+        self.assertEqual(archive[(0, 2)], 2)
+        self.assertEqual(archive[(1, 0)], 3)
+        self.assertEqual(archive[(2, 2)], 7)
+
+    def test___getitem___miss(self):
+        archive = self._makeFilled()
+        self.assertRaises(KeyError, archive.__getitem__, (1, 2))
+        self.assertRaises(KeyError, archive.__getitem__, (3, 0))
+        self.assertRaises(KeyError, archive.__getitem__, (-1, 0))
+
+    def test___getitem___empty(self):
+        archive = self._makeOne()
+        self.assertRaises(KeyError, archive.__getitem__, (0, 0))
+
+    def test_get(self):
+        archive = self._makeFilled()
+        self.assertEqual(archive.get((1, 1)), 4)
+        self.assertEqual(archive.get((1, 2)), None)
+        self.assertEqual(archive.get((1, 2), 42), 42)
+
+    def test_iter_range_empty(self):
+        archive = self._makeOne()
+        self.assertEqual(list(archive.iter_range()), [])
+        self.assertEqual(list(archive.iter_range(reverse=True)), [])
+
+    def test_iter_range_unbounded(self):
+        archive = self._makeFilled()
+        self.assertEqual(list(archive.iter_range()),
+                         [(0, 0, 0), (0, 1, 1), (0, 2, 2), (1, 0, 3),
+                          (1, 1, 4), (2, 0, 5), (2, 1, 6), (2, 2, 7)])
+        self.assertEqual(list(archive.iter_range(reverse=True)),
+                         list(archive))
+
+    def test_iter_range_bounded(self):
+        archive = self._makeFilled()
+        self.assertEqual(list(archive.iter_range((0, 2), (2, 1))),
+                         [(0, 2, 2), (1, 0, 3), (1, 1, 4), (2, 0, 5)])
+        self.assertEqual(list(archive.iter_range((0, 2), (2, 1), True)),
+                         [(2, 0, 5), (1, 1, 4), (1, 0, 3), (0, 2, 2)])
+
+    def test_iter_range_stops_walk_at_start(self):
+        archive = self._makeFilled()
+        archive._head._next._next._stack = None # gen 0 must not be read
+        self.assertEqual(list(archive.iter_range(start=(1, 1))),
+                         [(1, 1, 4), (2, 0, 5), (2, 1, 6), (2, 2, 7)])
+
     def test_addLayer_older(self):
         archive = self._makeOne()
         archive.addLayer(0, [])
         self.assertRaises(ValueError, archive.addLayer, 0, [])
 
+    def test_addLayer_copies(self):
+        archive = self._makeOne()
+        items = [1, 2]
+        archive.addLayer(0, items)
+        self.assertFalse(archive._head._stack is items)
+
+    def test_adoptLayer(self):
+        archive = self._makeOne()
+        items = [1, 2]
+        archive.adoptLayer(0, items)
+        self.assertTrue(archive._head._stack is items)
+        self.assertEqual(archive._generation, 0)
+        self.assertEqual(list(archive), [(0, 1, 2), (0, 0, 1)])
+
+    def test_adoptLayer_older(self):
+        archive = self._makeOne()
+        archive.adoptLayer(0, [])
+        self.assertRaises(ValueError, archive.adoptLayer, 0, [])
+
+    def test_adoptLayer_as_pruner(self):
+        from appendonly import AppendStack
+        stack = AppendStack(max_layers=2, max_length=2)
+        archive = self._makeOne()
+        stack.push_many(range(4), archive.adoptLayer)
+        layer = stack._layers[-1]
+        stack.push_many(range(4, 6), archive.adoptLayer)
+        self.assertTrue(archive._head._stack is layer._stack)
+        self.assertEqual([x[2] for x in archive], [1, 0])
+
+    def _makeCompacted(self, count=10, segment_size=3):
+        archive = self._makeOne()
+        for generation in range(count):
+            archive.addLayer(generation, [generation * 10, generation * 10 + 1])
+        created = archive.compact(segment_size)
+        return archive, created
+
+    def _nodes(self, archive):
+        nodes = []
+        current = archive._head
+        while current is not None:
+            nodes.append(current)
+            current = current._next
+        return nodes
+
+    def test_compact_empty(self):
+        archive = self._makeOne()
+        self.assertEqual(archive.compact(), 0)
+
+    def test_compact_too_few_layers(self):
+        archive, created = self._makeCompacted(count=3, segment_size=3)
+        self.assertEqual(created, 0) # the head is never compacted
+        self.assertEqual(len(self._nodes(archive)), 3)
+
+    def test_compact(self):
+        from appendonly import _ArchiveLayer
+        from appendonly import _ArchiveSegment
+        archive, created = self._makeCompacted()
+        self.assertEqual(created, 3)
+        nodes = self._nodes(archive)
+        self.assertEqual([type(x) for x in nodes],
+                         [_ArchiveLayer] + [_ArchiveSegment] * 3)
+        self.assertEqual([x._archivedGenerations() for x in nodes],
+                         [[9], [6, 7, 8], [3, 4, 5], [0, 1, 2]])
+        self.assertEqual(archive._generation, 9)
+
+    def test_compact_keeps_items(self):
+        archive, created = self._makeCompacted()
+        expected = [(generation, index, generation * 10 + index)
+                    for generation in range(10) for index in range(2)]
+        self.assertEqual(list(archive.iter_range()), expected)
+        self.assertEqual(list(archive), list(reversed(expected)))
+        self.assertEqual(list(archive.iter_range((2, 1), (7, 1))),
+                         expected[5:15])
+        self.assertEqual(list(archive.iter_range((2, 1), (7, 1),
+                                                 reverse=True)),
+                         list(reversed(expected[5:15])))
+
+    def test_compact_keeps_lookups(self):
+        archive, created = self._makeCompacted()
+        self.assertEqual(archive[(4, 1)], 41)
+        self.assertEqual(archive[(0, 0)], 0)
+        self.assertEqual(archive[(9, 1)], 91)
+        self.assertRaises(KeyError, archive.__getitem__, (4, 2))
+        self.assertRaises(KeyError, archive.__getitem__, (10, 0))
+        self.assertRaises(KeyError, archive.__getitem__, (-1, 0))
+
+    def test_compact_then_addLayer_and_compact(self):
+        archive, created = self._makeCompacted()
+        for generation in range(10, 13):
+            archive.addLayer(generation, [generation * 10])
+        self.assertEqual(archive.compact(3), 1)
+        self.assertEqual([x._archivedGenerations()
+                          for x in self._nodes(archive)],
+                         [[12], [9, 10, 11], [6, 7, 8], [3, 4, 5], [0, 1, 2]])
+        self.assertEqual(archive[(10, 0)], 100)
+        self.assertEqual([x[2] for x in archive][:4], [120, 110, 100, 91])
+
+    def test_compact_adopts_items(self):
+        archive = self._makeOne()
+        layers = [[0], [1], [2]]
+        for generation, items in enumerate(layers):
+            archive.adoptLayer(generation, items)
+        archive.compact(2)
+        segment = archive._head._next
+        self.assertTrue(segment._stacks[0] is layers[0])
+        self.assertTrue(segment._stacks[1] is layers[1])
+
     def test__p_resolveConflict_w_same_generation(self):
         O_STATE = {'_generation': -1, '_head': None}
         c_obj = object()
@@ -574,6 +1795,517 @@ class ArchiveTests(unittest.TestCase):
                           O_STATE, C_STATE, N_STATE)
 
 
+class IndexedArchiveTests(ArchiveTests):
+
+    def _makeOne(self):
+        return self._getTargetClass()(indexed=True)
+
+    def _unlink(self, archive):
+        # Lookups must not rely on the linked list.
+        current = archive._head
+        while current is not None:
+            current._next, current = None, current._next
+
+    def test_ctor_unindexed(self):
+        archive = self._getTargetClass()()
+        self.assertEqual(archive._index, None)
+        self.assertFalse('_index' in archive.__dict__)
+
+    def test_addLayer_fills_index_pages(self):
+        archive = self._makeOne()
+        archive._index_page_size = 2
+        for generation in range(5):
+            archive.addLayer(generation, [generation])
+        self.assertEqual(list(archive._index.keys()), [0, 2, 4])
+        self.assertEqual([x._generations for x in archive._index.values()],
+                         [[0, 1], [2, 3], [4]])
+
+    def test_addLayer_new_page_doesnt_write_archive_index(self):
+        from persistent import Persistent
+        archive = self._makeOne()
+        archive._index_page_size = 2
+        for generation in range(4):
+            archive.addLayer(generation, [generation])
+        self.assertTrue(isinstance(archive._index, Persistent))
+        self.assertFalse('_index_starts' in archive.__getstate__())
+
+    def test___getitem___uses_index(self):
+        archive = self._makeOne()
+        archive._index_page_size = 3
+        for generation in range(0, 20, 2):
+            archive.addLayer(generation, [generation, generation + 1])
+        self._unlink(archive)
+        self.assertEqual(archive[(6, 1)], 7)
+        self.assertEqual(archive[(0, 0)], 0)
+        self.assertEqual(archive[(18, 0)], 18)
+        self.assertRaises(KeyError, archive.__getitem__, (7, 0))
+        self.assertRaises(KeyError, archive.__getitem__, (-1, 0))
+        self.assertRaises(KeyError, archive.__getitem__, (20, 0))
+
+    def test_iter_range_uses_index(self):
+        archive = self._makeOne()
+        archive._index_page_size = 3
+        for generation in range(10):
+            archive.addLayer(generation, [generation * 10, generation * 10 + 1])
+        self._unlink(archive)
+        self.assertEqual(list(archive.iter_range((2, 1), (5, 1))),
+                         [(2, 1, 21), (3, 0, 30), (3, 1, 31), (4, 0, 40),
+                          (4, 1, 41), (5, 0, 50)])
+        self.assertEqual(list(archive.iter_range((7, 1), reverse=True)),
+                         [(9, 1, 91), (9, 0, 90), (8, 1, 81), (8, 0, 80),
+                          (7, 1, 71)])
+        self.assertEqual(list(archive.iter_range(stop=(0, 2))),
+                         [(0, 0, 0), (0, 1, 1)])
+        self.assertEqual(list(archive.iter_range(start=(10, 0))), [])
+        self.assertEqual(list(archive.iter_range(stop=(0, 0))), [])
+
+    def test_buildIndex(self):
+        archive = self._getTargetClass()()
+        for generation in range(5):
+            archive.addLayer(generation, [generation])
+        archive._index_page_size = 2
+        archive.buildIndex()
+        self.assertEqual(list(archive._index.keys()), [0, 2, 4])
+        archive.addLayer(5, [5])
+        self._unlink(archive)
+        self.assertEqual(archive[(1, 0)], 1)
+        self.assertEqual(archive[(5, 0)], 5)
+
+    def test_compact_updates_index(self):
+        archive = self._makeOne()
+        archive._index_page_size = 4
+        for generation in range(10):
+            archive.addLayer(generation, [generation * 10, generation * 10 + 1])
+        archive.compact(3)
+        nodes = archive._index[4]._layers # generations 4 - 7
+        self.assertTrue(nodes[0] is nodes[1])
+        self.assertTrue(nodes[2] is not nodes[1])
+        self._unlink(archive)
+        self.assertEqual(archive[(5, 1)], 51)
+        self.assertEqual([x[2] for x in archive.iter_range((2, 1), (4, 1))],
+                         [21, 30, 31, 40])
+
+    def test_buildIndex_after_compact(self):
+        archive = self._getTargetClass()()
+        for generation in range(5):
+            archive.addLayer(generation, [generation])
+        archive.compact(2)
+        archive._index_page_size = 3
+        archive.buildIndex()
+        self.assertEqual(list(archive._index.keys()), [0, 3])
+        self._unlink(archive)
+        self.assertEqual([x[2] for x in archive], [4, 3, 2, 1, 0])
+        self.assertEqual(archive[(3, 0)], 3)
+
+    def _pageState(self, generations, oids):
+        return {'_generations': list(generations),
+                '_layers': [_Ref(x) for x in oids]}
+
+    def _resolvePage(self, old, committed, new):
+        from appendonly import _ArchiveIndexPage
+        page = _ArchiveIndexPage()
+        return page._p_resolveConflict(old, committed, new)
+
+    def test__p_resolveConflict_index_page_same_generation(self):
+        O_STATE = self._pageState([0], [b'a'])
+        C_STATE = self._pageState([0, 1], [b'a', b'b'])
+        N_STATE = self._pageState([0, 1], [b'a', b'c'])
+        resolved = self._resolvePage(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(resolved['_generations'], [0, 1])
+        self.assertEqual([x.oid for x in resolved['_layers']], [b'a', b'b'])
+
+    def test__p_resolveConflict_index_page_different_generation(self):
+        from appendonly import ConflictError
+        O_STATE = self._pageState([0], [b'a'])
+        C_STATE = self._pageState([0, 1], [b'a', b'b'])
+        N_STATE = self._pageState([0, 2], [b'a', b'c'])
+        self.assertRaises(ConflictError, self._resolvePage,
+                          O_STATE, C_STATE, N_STATE)
+
+    def test__p_resolveConflict_index_page_replace_and_add(self):
+        O_STATE = self._pageState([0, 1, 2], [b'a', b'b', b'c'])
+        C_STATE = self._pageState([0, 1, 2, 3], [b'a', b'b', b'c', b'd'])
+        N_STATE = self._pageState([0, 1, 2], [b's', b's', b'c'])
+        for committed, new in ((C_STATE, N_STATE), (N_STATE, C_STATE)):
+            resolved = self._resolvePage(O_STATE, committed, new)
+            self.assertEqual(resolved['_generations'], [0, 1, 2, 3])
+            self.assertEqual([x.oid for x in resolved['_layers']],
+                             [b's', b's', b'c', b'd'])
+
+    def test__p_resolveConflict_index_page_conflicting_replace(self):
+        from appendonly import ConflictError
+        O_STATE = self._pageState([0, 1], [b'a', b'b'])
+        C_STATE = self._pageState([0, 1], [b's', b's'])
+        N_STATE = self._pageState([0, 1], [b't', b't'])
+        self.assertRaises(ConflictError, self._resolvePage,
+                          O_STATE, C_STATE, N_STATE)
+
+
+class IndexedArchiveDBTests(_DBTestBase, unittest.TestCase):
+
+    def test_concurrent_addLayer_same_generation(self):
+        from appendonly import Archive
+        db = self._makeDB()
+        tm1, conn1 = self._open(db)
+        conn1.root()['archive'] = Archive(indexed=True)
+        conn1.root()['archive'].addLayer(0, [0])
+        tm1.commit()
+        tm2, conn2 = self._open(db)
+        conn1.root()['archive'].addLayer(1, [1])
+        conn2.root()['archive'].addLayer(1, [1])
+        tm1.commit()
+        tm2.commit()
+        tm3, conn3 = self._open(db)
+        archive = conn3.root()['archive']
+        self.assertEqual(list(archive), [(1, 0, 1), (0, 0, 0)])
+        self.assertEqual(archive[(1, 0)], 1)
+
+
+class ArchiveCompactDBTests(_DBTestBase, unittest.TestCase):
+
+    def _makeArchive(self, db, indexed=False, count=5):
+        from appendonly import Archive
+        tm, conn = self._open(db)
+        archive = conn.root()['archive'] = Archive(indexed=indexed)
+        for generation in range(count):
+            archive.addLayer(generation, [generation])
+        tm.commit()
+
+    def test_compact_persists(self):
+        db = self._makeDB()
+        self._makeArchive(db)
+        tm, conn = self._open(db)
+        self.assertEqual(conn.root()['archive'].compact(2), 2)
+        tm.commit()
+        tm, conn = self._open(db)
+        archive = conn.root()['archive']
+        self.assertEqual([x[2] for x in archive], [4, 3, 2, 1, 0])
+        self.assertEqual(archive[(1, 0)], 1)
+
+    def test_compact_concurrent_w_addLayer(self):
+        db = self._makeDB()
+        self._makeArchive(db)
+        tm1, conn1 = self._open(db)
+        tm2, conn2 = self._open(db)
+        conn1.root()['archive'].compact(2)
+        conn2.root()['archive'].addLayer(5, [5])
+        tm2.commit()
+        tm1.commit()
+        tm, conn = self._open(db)
+        archive = conn.root()['archive']
+        self.assertEqual([x[2] for x in archive], [5, 4, 3, 2, 1, 0])
+        self.assertEqual(archive._head._next._next.__class__.__name__,
+                         '_ArchiveSegment')
+
+    def test_compact_indexed_concurrent_w_addLayer(self):
+        db = self._makeDB()
+        self._makeArchive(db, indexed=True)
+        tm1, conn1 = self._open(db)
+        tm2, conn2 = self._open(db)
+        conn1.root()['archive'].compact(2)
+        conn2.root()['archive'].addLayer(5, [5])
+        tm2.commit()
+        tm1.commit()
+        tm, conn = self._open(db)
+        archive = conn.root()['archive']
+        self.assertEqual([x[2] for x in archive], [5, 4, 3, 2, 1, 0])
+        self.assertEqual(archive[(5, 0)], 5)
+        self.assertEqual(archive[(1, 0)], 1)
+        layers = archive._index[0]._layers
+        self.assertEqual(layers[0].__class__.__name__, '_ArchiveSegment')
+        self.assertTrue(layers[0] is layers[1])
+        self.assertTrue(layers[5] is archive._head)
+
+
+class ArchivePrefetchTests(_DBTestBase, unittest.TestCase):
+
+    def _makeArchive(self, indexed, count=10):
+        from appendonly import Archive
+        db = self._makeDB()
+        tm, conn = self._open(db)
+        archive = conn.root()['archive'] = Archive(indexed=indexed)
+        for generation in range(count):
+            archive.addLayer(generation, [generation])
+        tm.commit()
+        tm, conn = self._open(db)
+        prefetched = []
+        def _prefetch(*args):
+            for arg in args:
+                prefetched.append([x._generation for x in arg])
+        conn.prefetch = _prefetch
+        return conn.root()['archive'], prefetched
+
+    def test_indexed_prefetches_in_batches(self):
+        archive, prefetched = self._makeArchive(True)
+        archive.prefetch_depth = 4
+        found = [x[0] for x in archive]
+        self.assertEqual(found, list(reversed(range(10))))
+        self.assertEqual(prefetched, [[9, 8, 7, 6], [5, 4, 3, 2], [1, 0]])
+
+    def test_indexed_iter_range_w_prefetch(self):
+        archive, prefetched = self._makeArchive(True)
+        found = [x[0] for x in archive.iter_range((3, 0), (8, 0),
+                                                  prefetch=2)]
+        self.assertEqual(found, [3, 4, 5, 6, 7])
+        self.assertEqual(prefetched, [[3, 4], [5, 6], [7, 8]])
+
+    def test_indexed_wo_prefetch(self):
+        archive, prefetched = self._makeArchive(True)
+        found = [x[0] for x in archive.iter_range(prefetch=0)]
+        self.assertEqual(found, list(range(10)))
+        self.assertEqual(prefetched, [])
+
+    def test_unindexed_prefetches_next_layer(self):
+        archive, prefetched = self._makeArchive(False, count=3)
+        found = [x[0] for x in archive]
+        self.assertEqual(found, [2, 1, 0])
+        self.assertEqual(prefetched, [[1], [0]])
+
+
+class ArchiveBufferTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from appendonly import ArchiveBuffer
+        return ArchiveBuffer
+
+    def _makeOne(self, archive=None, flush_after=None):
+        from appendonly import Archive
+        if archive is None:
+            archive = Archive()
+        return self._getTargetClass()(archive, flush_after)
+
+    def test_ctor(self):
+        buffer = self._makeOne()
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(list(buffer), [])
+
+    def test_addLayer_defers(self):
+        buffer = self._makeOne()
+        buffer.addLayer(0, [1, 2])
+        buffer.addLayer(1, [3])
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(list(buffer), [(1, [3]), (0, [1, 2])])
+        self.assertEqual(list(buffer._archive), [])
+
+    def test_flush(self):
+        buffer = self._makeOne()
+        buffer.addLayer(1, [3])
+        buffer.addLayer(0, [1, 2])
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(list(buffer._archive),
+                         [(1, 0, 3), (0, 1, 2), (0, 0, 1)])
+
+    def test_flush_skips_archived_generations(self):
+        from appendonly import Archive
+        archive = Archive()
+        archive.addLayer(0, [1, 2])
+        buffer = self._makeOne(archive)
+        buffer.addLayer(0, [1, 2])
+        buffer.addLayer(1, [3])
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(list(archive), [(1, 0, 3), (0, 1, 2), (0, 0, 1)])
+
+    def test_addLayer_w_flush_after(self):
+        buffer = self._makeOne(flush_after=2)
+        buffer.addLayer(0, [1])
+        self.assertEqual(len(buffer), 1)
+        buffer.addLayer(1, [2])
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer._archive._generation, 1)
+
+    def test_as_pruner(self):
+        from appendonly import AppendStack
+        stack = AppendStack(max_layers=2, max_length=2)
+        buffer = self._makeOne()
+        stack.push_many(range(9), buffer.addLayer)
+        self.assertEqual(list(buffer), [(2, [4, 5]), (1, [2, 3]), (0, [0, 1])])
+        buffer.flush()
+        self.assertEqual([x[2] for x in buffer._archive], list(range(5, -1, -1)))
+
+    def test_flush_adopts_items(self):
+        buffer = self._makeOne()
+        items = [1, 2]
+        buffer.addLayer(0, items)
+        buffer.flush()
+        self.assertTrue(buffer._archive._head._stack is items)
+
+
+class ArchiveBufferDBTests(_DBTestBase, unittest.TestCase):
+
+    def test_concurrent_prune_and_flush(self):
+        from appendonly import AppendStack
+        from appendonly import Archive
+        from appendonly import ArchiveBuffer
+        db = self._makeDB()
+        tm, conn = self._open(db)
+        root = conn.root()
+        root['stack'] = AppendStack(max_layers=2, max_length=2)
+        root['buffer'] = ArchiveBuffer(Archive())
+        root['stack'].push_many(range(6), root['buffer'].addLayer)
+        tm.commit()
+        tm1, conn1 = self._open(db)
+        tm2, conn2 = self._open(db)
+        conn1.root()['buffer'].flush()
+        root2 = conn2.root()
+        root2['stack'].push_many(range(6, 8), root2['buffer'].addLayer)
+        tm1.commit()
+        tm2.commit()
+        tm, conn = self._open(db)
+        buffer = conn.root()['buffer']
+        self.assertEqual(list(buffer), [(1, [2, 3])])
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual([x[2] for x in buffer._archive], [3, 2, 1, 0])
+
+    def test_addLayer_writes_only_tail_chunk(self):
+        from appendonly import Archive
+        from appendonly import ArchiveBuffer
+        db = self._makeDB()
+        tm, conn = self._open(db)
+        buffer = conn.root()['buffer'] = ArchiveBuffer(Archive())
+        for generation in range(250):
+            buffer.addLayer(generation, [generation])
+        tm.commit()
+        buffer.addLayer(250, [250])
+        pending = buffer._pending
+        self.assertFalse(buffer._p_changed)
+        self.assertFalse(pending._p_changed)
+        self.assertEqual([x._p_changed for x in pending._chunks[:-1]],
+                         [False, False])
+        self.assertTrue(pending._chunks[-1]._p_changed)
+        tm.commit()
+        tm, conn = self._open(db)
+        buffer = conn.root()['buffer']
+        self.assertEqual(len(buffer), 251)
+        self.assertEqual(buffer.flush(), 251)
+        self.assertEqual(buffer._archive[(250, 0)], 250)
+
+    def test_concurrent_pushes_dont_lose_layers(self):
+        from appendonly import AppendStack
+        from appendonly import Archive
+        from appendonly import ArchiveBuffer
+        db = self._makeDB()
+        tm, conn = self._open(db)
+        root = conn.root()
+        root['stack'] = AppendStack(max_layers=2, max_length=3)
+        root['buffer'] = ArchiveBuffer(Archive())
+        tm.commit()
+        tm1, conn1 = self._open(db)
+        tm2, conn2 = self._open(db)
+        root1, root2 = conn1.root(), conn2.root()
+        root1['stack'].push_many(['c0', 'c1', 'c2'], root1['buffer'].addLayer)
+        root2['stack'].push_many(['n0', 'n1', 'n2', 'n3'],
+                                 root2['buffer'].addLayer)
+        tm1.commit()
+        tm2.commit()
+        tm, conn = self._open(db)
+        root = conn.root()
+        # The merged stack keeps its layers past 'max_layers' until the
+        # next push which adds a layer.
+        self.assertEqual(len(root['stack']._layers), 3)
+        root['stack'].push_many(['x0', 'x1', 'x2'], root['buffer'].addLayer)
+        self.assertEqual(len(root['stack']._layers), 2)
+        tm.commit()
+        kept = [x[2] for x in root['stack']]
+        root['buffer'].flush()
+        archived = [x[2] for x in root['buffer']._archive.iter_range()]
+        self.assertEqual(sorted(kept + archived),
+                         ['c0', 'c1', 'c2', 'n0', 'n1', 'n2', 'n3',
+                          'x0', 'x1', 'x2'])
+
+
+class HistoryTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from appendonly import History
+        return History
+
+    def _makeOne(self, count=10, max_layers=2, max_length=2):
+        from appendonly import AppendStack
+        from appendonly import Archive
+        stack = AppendStack(max_layers, max_length)
+        archive = Archive()
+        stack.push_many(range(count), archive.addLayer)
+        return self._getTargetClass()(stack, archive)
+
+    def test_ctor(self):
+        history = self._makeOne()
+        self.assertEqual(history.stack._max_layers, 2)
+        self.assertEqual(history.archive._generation, 2)
+
+    def test___iter__(self):
+        history = self._makeOne()
+        self.assertEqual([x[2] for x in history], list(range(9, -1, -1)))
+        self.assertEqual(list(history)[3:7],
+                         [(3, 0, 6), (2, 1, 5), (2, 0, 4), (1, 1, 3)])
+
+    def test___iter___wo_pruning(self):
+        history = self._makeOne(count=3)
+        self.assertEqual([x[2] for x in history], [2, 1, 0])
+
+    def test___getitem__(self):
+        history = self._makeOne()
+        self.assertEqual(history[(4, 1)], 9)
+        self.assertEqual(history[(3, 0)], 6)
+        self.assertEqual(history[(2, 1)], 5)
+        self.assertEqual(history[(0, 0)], 0)
+        self.assertRaises(KeyError, history.__getitem__, (5, 0))
+        self.assertRaises(KeyError, history.__getitem__, (-1, 0))
+
+    def test___getitem___doesnt_read_archive_for_live_keys(self):
+        history = self._makeOne()
+        history.archive = None
+        self.assertEqual(history[(3, 1)], 7)
+
+    def test_get(self):
+        history = self._makeOne()
+        self.assertEqual(history.get((1, 0)), 2)
+        self.assertEqual(history.get((9, 0), 'miss'), 'miss')
+
+    def test_newer(self):
+        history = self._makeOne()
+        self.assertEqual([x[2] for x in history.newer(1, 0)],
+                         [9, 8, 7, 6, 5, 4, 3])
+
+    def test_newer_w_limit(self):
+        history = self._makeOne()
+        self.assertEqual([x[2] for x in history.newer(1, 0, limit=2)],
+                         [9, 8])
+        self.assertEqual(list(history.newer(1, 0, limit=0)), [])
+
+    def test_newer_within_stack_doesnt_read_archive(self):
+        history = self._makeOne()
+        history.archive = None
+        self.assertEqual([x[2] for x in history.newer(3, 0)], [9, 8, 7])
+
+    def test_iter_range_spanning(self):
+        history = self._makeOne()
+        self.assertEqual([x[2] for x in history.iter_range((1, 1), (3, 1))],
+                         [3, 4, 5, 6])
+        self.assertEqual([x[2] for x in history.iter_range((1, 1), (3, 1),
+                                                           reverse=True)],
+                         [6, 5, 4, 3])
+
+    def test_iter_range_archive_only(self):
+        history = self._makeOne()
+        def _fail(*args):
+            raise AssertionError('stack range read')
+        history.stack.iter_range = _fail
+        self.assertEqual([x[2] for x in history.iter_range((0, 1), (2, 0))],
+                         [1, 2, 3])
+
+    def test_iter_range_stack_only(self):
+        history = self._makeOne()
+        history.archive = None
+        self.assertEqual([x[2] for x in history.iter_range(start=(3, 1))],
+                         [7, 8, 9])
+
+    def test_iter_range_unbounded(self):
+        history = self._makeOne()
+        self.assertEqual([x[2] for x in history.iter_range()],
+                         list(range(10)))
+
+
 class AccumulatorTests(unittest.TestCase):
 
     def _getTargetClass(self):
@@ -604,6 +2336,12 @@ class AccumulatorTests(unittest.TestCase):
         aclist = self._makeOne(VALUE)
         self.assertEqual(list(aclist), VALUE)
 
+    def test___len__(self):
+        aclist = self._makeOne([0, 1, 2])
+        self.assertEqual(len(aclist), 3)
+        aclist.consume(2)
+        self.assertEqual(len(aclist), 1)
+
     def test_append(self):
         VALUE = [0, 1, 2]
         aclist = self._makeOne()
@@ -624,25 +2362,170 @@ class AccumulatorTests(unittest.TestCase):
         self.assertEqual(result, VALUE)
         self.assertEqual(list(aclist), [])
 
+    def test_consume_w_max_items(self):
+        aclist = self._makeOne([0, 1, 2, 3, 4])
+        self.assertEqual(aclist.consume(2), [0, 1])
+        self.assertEqual(list(aclist), [2, 3, 4])
+        self.assertEqual(aclist.consume(5), [2, 3, 4])
+        self.assertEqual(list(aclist), [])
+        self.assertEqual(aclist._consumed, 5)
+
+    def test_consume_w_max_items_zero(self):
+        aclist = self._makeOne([0, 1])
+        self.assertEqual(aclist.consume(0), [])
+        self.assertEqual(list(aclist), [0, 1])
+
+    def test_drain(self):
+        aclist = self._makeOne(range(7))
+        batches = []
+        for batch in aclist.drain(3):
+            batches.append(batch)
+            self.assertEqual(len(list(aclist)), 7 - sum(map(len, batches)))
+        self.assertEqual(batches, [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(aclist._consumed, 7)
+
+    def test_drain_empty(self):
+        aclist = self._makeOne()
+        self.assertEqual(list(aclist.drain()), [])
+
+    def test_drain_w_invalid_batch_size(self):
+        aclist = self._makeOne(range(3))
+        self.assertRaises(ValueError, aclist.drain, 0)
+        self.assertRaises(ValueError, aclist.drain, -1)
+        self.assertEqual(list(aclist), [0, 1, 2])
+
     def test___getstate___empty(self):
         aclist = self._makeOne()
-        self.assertEqual(aclist.__getstate__(), [])
+        self.assertEqual(aclist.__getstate__(), (0, []))
 
     def test___getstate___filled(self):
         VALUE = [0, 1, 2]
         aclist = self._makeOne(VALUE)
-        self.assertEqual(aclist.__getstate__(), VALUE)
+        self.assertEqual(aclist.__getstate__(), (0, VALUE))
+
+    def test___getstate___after_consume(self):
+        aclist = self._makeOne([0, 1, 2])
+        aclist.consume()
+        aclist.append(3)
+        self.assertEqual(aclist.__getstate__(), (3, [3]))
 
     def test___setstate___empty(self):
         aclist = self._makeOne([0, 1, 2])
-        aclist.__setstate__([])
+        aclist.__setstate__((3, []))
         self.assertEqual(list(aclist), [])
+        self.assertEqual(aclist._consumed, 3)
 
     def test___setstate___filled(self):
+        VALUE = [0, 1, 2]
+        aclist = self._makeOne()
+        aclist.__setstate__((5, VALUE))
+        self.assertEqual(list(aclist), VALUE)
+        self.assertEqual(aclist._consumed, 5)
+
+    def test___setstate___legacy_list(self):
         VALUE = [0, 1, 2]
         aclist = self._makeOne()
         aclist.__setstate__(VALUE)
         self.assertEqual(list(aclist), VALUE)
+        self.assertEqual(aclist._consumed, 0)
+
+    def test__p_resolveConflict_counted_both_append(self):
+        O_STATE = (7, [1, 2, 3])
+        C_STATE = (7, [1, 2, 3, 4])
+        N_STATE = (7, [1, 2, 3, 5, 6])
+        aclist = self._makeOne()
+        resolved = aclist._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(resolved, (7, [1, 2, 3, 4, 5, 6]))
+
+    def test__p_resolveConflict_counted_doesnt_compare_items(self):
+        class _Uncomparable(object):
+            def __eq__(self, other):
+                raise AssertionError('compared')
+            __ne__ = __eq__
+        ITEMS = [_Uncomparable() for x in range(3)]
+        O_STATE = (0, ITEMS)
+        C_STATE = (0, ITEMS + [4])
+        N_STATE = (3, [5])
+        aclist = self._makeOne()
+        resolved = aclist._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(resolved, (3, [4, 5]))
+
+    def test__p_resolveConflict_counted_c_consume_n_append(self):
+        O_STATE = (0, [1, 2, 3])
+        C_STATE = (3, [])
+        N_STATE = (0, [1, 2, 3, 4])
+        aclist = self._makeOne()
+        resolved = aclist._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(resolved, (3, [4]))
+
+    def test__p_resolveConflict_counted_both_consume_append(self):
+        O_STATE = (0, [1, 2, 3])
+        C_STATE = (3, [4, 5])
+        N_STATE = (3, [6])
+        aclist = self._makeOne()
+        resolved = aclist._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(resolved, (3, [4, 5, 6]))
+
+    def test__p_resolveConflict_counted_c_partial_consume_n_append(self):
+        O_STATE = (0, [1, 2, 3])
+        C_STATE = (2, [3, 4])
+        N_STATE = (0, [1, 2, 3, 5])
+        aclist = self._makeOne()
+        resolved = aclist._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(resolved, (2, [3, 4, 5]))
+
+    def test__p_resolveConflict_counted_n_partial_consume_c_append(self):
+        O_STATE = (0, [1, 2, 3])
+        C_STATE = (0, [1, 2, 3, 4])
+        N_STATE = (1, [2, 3])
+        aclist = self._makeOne()
+        resolved = aclist._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(resolved, (1, [2, 3, 4]))
+
+    def test__p_resolveConflict_counted_both_partial_consume(self):
+        O_STATE = (0, [1, 2, 3, 4])
+        C_STATE = (1, [2, 3, 4, 5])
+        N_STATE = (2, [3, 4, 6])
+        aclist = self._makeOne()
+        resolved = aclist._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(resolved, (2, [3, 4, 5, 6]))
+
+    def test__p_resolveConflict_counted_consume_past_old(self):
+        O_STATE = (0, [1, 2])
+        C_STATE = (0, [1, 2, 3])
+        N_STATE = (3, [5])  # consumed 1, 2, and its own append of 4
+        aclist = self._makeOne()
+        resolved = aclist._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        # Keep committed's numbering:  3 follows the two consumed items.
+        self.assertEqual(resolved, (2, [3, 5]))
+
+    def test__p_resolveConflict_counted_consumed_backwards(self):
+        from appendonly import ConflictError
+        aclist = self._makeOne()
+        self.assertRaises(ConflictError, aclist._p_resolveConflict,
+                          (2, [3]), (1, [2, 3]), (2, [3, 4]))
+
+    def test__p_resolveConflict_counted_dropped_unconsumed(self):
+        from appendonly import ConflictError
+        aclist = self._makeOne()
+        self.assertRaises(ConflictError, aclist._p_resolveConflict,
+                          (0, [1, 2, 3]), (0, [1]), (0, [1, 2, 3, 4]))
+
+    def test__p_resolveConflict_counted_w_legacy_old(self):
+        O_STATE = [1, 2, 3]
+        C_STATE = (3, [4])
+        N_STATE = (0, [1, 2, 3, 5])
+        aclist = self._makeOne()
+        resolved = aclist._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(resolved, (3, [4, 5]))
+
+    def test__p_resolveConflict_w_legacy_committed(self):
+        O_STATE = [1, 2, 3]
+        C_STATE = [1, 2, 3, 4]
+        N_STATE = (3, [5])
+        aclist = self._makeOne()
+        resolved = aclist._p_resolveConflict(O_STATE, C_STATE, N_STATE)
+        self.assertEqual(resolved, [4, 5])
 
     def test__p_resolveConflict_w_both_append(self):
         O_STATE = [1, 2, 3]
@@ -779,3 +2662,434 @@ class AccumulatorTests(unittest.TestCase):
         aclist = self._makeOne()
         resolved = aclist._p_resolveConflict(O_STATE, C_STATE, N_STATE)
         self.assertEqual(resolved, [4, 5, 6, 7])
+
+
+class _Ref(object):
+    # Stand-in for ZODB's PersistentReference during conflict resolution.
+    def __init__(self, oid):
+        self.oid = oid
+
+
+class AccumulatorChunkTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from appendonly import _AccumulatorChunk
+        return _AccumulatorChunk
+
+    def _makeOne(self, *args):
+        return self._getTargetClass()(*args)
+
+    def test___getstate__(self):
+        chunk = self._makeOne([1, 2])
+        self.assertEqual(chunk.__getstate__(), (0, [1, 2]))
+        chunk._list = None
+        self.assertEqual(chunk.__getstate__(), None)
+
+    def test___setstate__(self):
+        chunk = self._makeOne()
+        chunk.__setstate__((2, [3]))
+        self.assertEqual((chunk._consumed, chunk._list), (2, [3]))
+        chunk.__setstate__(None)
+        self.assertEqual(chunk._list, None)
+
+    def test___setstate___legacy_list(self):
+        chunk = self._makeOne()
+        chunk.__setstate__([1, 2])
+        self.assertEqual((chunk._consumed, chunk._list), (0, [1, 2]))
+
+    def test__p_resolveConflict_both_append(self):
+        chunk = self._makeOne()
+        resolved = chunk._p_resolveConflict((0, [1]), (0, [1, 2]),
+                                            (0, [1, 3]))
+        self.assertEqual(resolved, (0, [1, 2, 3]))
+
+    def test__p_resolveConflict_clear_and_append(self):
+        chunk = self._makeOne()
+        resolved = chunk._p_resolveConflict((0, [1]), (1, []), (0, [1, 3]))
+        self.assertEqual(resolved, (1, [3]))
+
+    def test__p_resolveConflict_clear_after_resolved_clear(self):
+        # Committed's state was itself resolved from a clear of [1, 2] and
+        # the appending of [3, 4]:  it must not read as a clear-and-append.
+        chunk = self._makeOne()
+        resolved = chunk._p_resolveConflict((0, [1, 2, 3, 4]), (2, [3, 4]),
+                                            (4, []))
+        self.assertEqual(resolved, (4, []))
+
+    def test__p_resolveConflict_legacy_lists(self):
+        chunk = self._makeOne()
+        resolved = chunk._p_resolveConflict([1], [], [1, 3])
+        self.assertEqual(resolved, [3])
+
+    def test__p_resolveConflict_both_retired(self):
+        chunk = self._makeOne()
+        self.assertEqual(chunk._p_resolveConflict((0, [1]), None, None), None)
+
+    def test__p_resolveConflict_retired_and_rewritten_empty(self):
+        chunk = self._makeOne()
+        self.assertEqual(chunk._p_resolveConflict((0, []), None, (0, [])),
+                         None)
+        self.assertEqual(chunk._p_resolveConflict((0, []), (0, []), None),
+                         None)
+
+    def test__p_resolveConflict_retired_and_cleared(self):
+        chunk = self._makeOne()
+        self.assertEqual(chunk._p_resolveConflict((0, [1]), None, (1, [])),
+                         None)
+        self.assertEqual(chunk._p_resolveConflict((0, [1]), (1, []), None),
+                         None)
+        self.assertEqual(chunk._p_resolveConflict([1], None, []), None)
+
+    def test__p_resolveConflict_retired_and_appended(self):
+        from appendonly import ConflictError
+        chunk = self._makeOne()
+        self.assertRaises(ConflictError, chunk._p_resolveConflict,
+                          (0, [1]), None, (0, [1, 2]))
+        self.assertRaises(ConflictError, chunk._p_resolveConflict,
+                          (0, [1]), (0, [1, 2]), None)
+        self.assertRaises(ConflictError, chunk._p_resolveConflict,
+                          [1], [1, 2], None)
+
+    def test__p_resolveConflict_retired_and_partly_consumed(self):
+        chunk = self._makeOne()
+        self.assertEqual(chunk._p_resolveConflict((0, [1, 2]), None, (1, [2])),
+                         None)
+        self.assertEqual(chunk._p_resolveConflict((0, [1, 2]), (1, [2]), None),
+                         None)
+
+    def test__p_resolveConflict_retired_and_partly_consumed_appended(self):
+        from appendonly import ConflictError
+        chunk = self._makeOne()
+        self.assertRaises(ConflictError, chunk._p_resolveConflict,
+                          (0, [1, 2]), None, (1, [2, 3]))
+
+
+class ChunkedAccumulatorTests(_DBTestBase, unittest.TestCase):
+
+    def _getTargetClass(self):
+        from appendonly import ChunkedAccumulator
+        return ChunkedAccumulator
+
+    def _makeOne(self, *args, **kw):
+        return self._getTargetClass()(*args, **kw)
+
+    def test_ctor_defaults(self):
+        acc = self._makeOne()
+        self.assertEqual(acc._chunk_size, 100)
+        self.assertEqual(list(acc), [])
+        self.assertEqual(len(acc._chunks), 1)
+
+    def test_ctor_w_value(self):
+        acc = self._makeOne(range(5), chunk_size=2)
+        self.assertEqual(list(acc), [0, 1, 2, 3, 4])
+        self.assertEqual([x._list for x in acc._chunks],
+                         [[0, 1], [2, 3], [4]])
+
+    def test_append_and_extend(self):
+        acc = self._makeOne(chunk_size=3)
+        acc.append(0)
+        acc.extend([1, 2, 3])
+        acc.append(4)
+        self.assertEqual(list(acc), [0, 1, 2, 3, 4])
+        self.assertEqual([x._list for x in acc._chunks], [[0, 1, 2], [3, 4]])
+
+    def test___len__(self):
+        acc = self._makeOne(range(5), chunk_size=2)
+        self.assertEqual(len(acc), 5)
+        acc.consume()
+        self.assertEqual(len(acc), 0)
+
+    def test_consume(self):
+        acc = self._makeOne(range(5), chunk_size=2)
+        chunks = acc._chunks[:]
+        self.assertEqual(acc.consume(), [0, 1, 2, 3, 4])
+        self.assertEqual(list(acc), [])
+        self.assertEqual(acc._chunks, [chunks[-1]])
+        self.assertEqual([x._list for x in chunks], [None, None, []])
+        self.assertEqual(chunks[-1]._consumed, 1)
+        acc.append(5)
+        self.assertEqual(list(acc), [5])
+
+    def test_consume_w_max_items(self):
+        acc = self._makeOne(range(5), chunk_size=2)
+        chunks = acc._chunks[:]
+        self.assertEqual(acc.consume(3), [0, 1, 2])
+        self.assertEqual(list(acc), [3, 4])
+        self.assertEqual(acc._chunks, chunks[1:])
+        self.assertEqual([x._list for x in chunks], [None, [3], [4]])
+        self.assertEqual([x._consumed for x in chunks], [0, 1, 0])
+        self.assertEqual(acc.consume(5), [3, 4])
+        self.assertEqual(list(acc), [])
+        self.assertEqual(acc._chunks, chunks[2:])
+
+    def test_consume_w_max_items_at_chunk_boundary(self):
+        acc = self._makeOne(range(5), chunk_size=2)
+        chunks = acc._chunks[:]
+        self.assertEqual(acc.consume(2), [0, 1])
+        self.assertEqual(acc._chunks, chunks[1:])
+        self.assertEqual([x._list for x in chunks], [None, [2, 3], [4]])
+
+    def test_consume_w_max_items_zero(self):
+        acc = self._makeOne(range(3), chunk_size=2)
+        chunks = acc._chunks[:]
+        self.assertEqual(acc.consume(0), [])
+        self.assertEqual(list(acc), [0, 1, 2])
+        self.assertEqual(acc._chunks, chunks)
+
+    def test_drain(self):
+        acc = self._makeOne(range(7), chunk_size=2)
+        batches = []
+        for batch in acc.drain(3):
+            batches.append(batch)
+            self.assertEqual(len(acc), 7 - sum(map(len, batches)))
+        self.assertEqual(batches, [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(len(acc._chunks), 1)
+
+    def test_drain_w_invalid_batch_size(self):
+        acc = self._makeOne(range(3))
+        self.assertRaises(ValueError, acc.drain, 0)
+        self.assertRaises(ValueError, acc.drain, -1)
+        self.assertEqual(list(acc), [0, 1, 2])
+
+    def test___getstate__(self):
+        acc = self._makeOne(chunk_size=3)
+        self.assertEqual(acc.__getstate__(), (3, acc._chunks))
+
+    def test__p_resolveConflict_mismatched_chunk_size(self):
+        from appendonly import ConflictError
+        acc = self._makeOne()
+        a = _Ref(b'a')
+        self.assertRaises(ConflictError, acc._p_resolveConflict,
+                          (2, [a]), (2, [a]), (3, [a]))
+
+    def test__p_resolveConflict_both_add_chunks(self):
+        a, b, c, d = [_Ref(x) for x in (b'a', b'b', b'c', b'd')]
+        acc = self._makeOne()
+        size, chunks = acc._p_resolveConflict((2, [a, b]),
+                                              (2, [a, b, c]),
+                                              (2, [a, b, d]))
+        self.assertEqual(size, 2)
+        self.assertEqual([x.oid for x in chunks], [b'a', b'b', b'c', b'd'])
+
+    def test__p_resolveConflict_new_consumed(self):
+        a, b, c, d = [_Ref(x) for x in (b'a', b'b', b'c', b'd')]
+        acc = self._makeOne()
+        size, chunks = acc._p_resolveConflict((2, [a, b]),
+                                              (2, [a, b, c]),
+                                              (2, [b, d]))
+        self.assertEqual([x.oid for x in chunks], [b'b', b'c', b'd'])
+
+    def test__p_resolveConflict_committed_consumed(self):
+        a, b, c = [_Ref(x) for x in (b'a', b'b', b'c')]
+        acc = self._makeOne()
+        size, chunks = acc._p_resolveConflict((2, [a, b]),
+                                              (2, [b]),
+                                              (2, [a, b, c]))
+        self.assertEqual([x.oid for x in chunks], [b'b', b'c'])
+
+    def test__p_resolveConflict_both_consumed(self):
+        a, b, c = [_Ref(x) for x in (b'a', b'b', b'c')]
+        acc = self._makeOne()
+        size, chunks = acc._p_resolveConflict((2, [a, b]),
+                                              (2, [b, c]),
+                                              (2, [_Ref(b'b')]))
+        self.assertEqual([x.oid for x in chunks], [b'b', b'c'])
+
+    def test__p_resolveConflict_committed_retired_new_kept(self):
+        a, b, c = [_Ref(x) for x in (b'a', b'b', b'c')]
+        acc = self._makeOne()
+        size, chunks = acc._p_resolveConflict((2, [a, b]),
+                                              (2, [c]),
+                                              (2, [_Ref(b'b')]))
+        self.assertEqual([x.oid for x in chunks], [b'c'])
+
+    def test_append_writes_only_tail_chunk(self):
+        db = self._makeDB()
+        tm, conn = self._open(db)
+        acc = conn.root()['acc'] = self._makeOne(range(3), chunk_size=2)
+        tm.commit()
+        acc.append(3)
+        self.assertFalse(acc._p_changed)
+        self.assertFalse(acc._chunks[0]._p_changed)
+        self.assertTrue(acc._chunks[1]._p_changed)
+        tm.commit()
+
+    def test_concurrent_appends_resolve(self):
+        db = self._makeDB()
+        tm1, conn1 = self._open(db)
+        conn1.root()['acc'] = self._makeOne(range(3), chunk_size=4)
+        tm1.commit()
+        tm2, conn2 = self._open(db)
+        conn1.root()['acc'].extend([3, 4, 5])
+        conn2.root()['acc'].extend([6, 7, 8])
+        tm1.commit()
+        tm2.commit()
+        tm3, conn3 = self._open(db)
+        found = list(conn3.root()['acc'])
+        # Each writer's items keep their order, but may interleave.
+        self.assertEqual(sorted(found), [0, 1, 2, 3, 4, 5, 6, 7, 8])
+        self.assertEqual([x for x in found if x in (3, 4, 5)], [3, 4, 5])
+        self.assertEqual([x for x in found if x in (6, 7, 8)], [6, 7, 8])
+
+    def test_concurrent_consume_and_append_resolve(self):
+        db = self._makeDB()
+        tm1, conn1 = self._open(db)
+        conn1.root()['acc'] = self._makeOne(range(3), chunk_size=2)
+        tm1.commit()
+        tm2, conn2 = self._open(db)
+        self.assertEqual(conn1.root()['acc'].consume(), [0, 1, 2])
+        conn2.root()['acc'].extend([3, 4, 5])
+        tm1.commit()
+        tm2.commit()
+        tm3, conn3 = self._open(db)
+        self.assertEqual(list(conn3.root()['acc']), [3, 4, 5])
+
+    def test_concurrent_consumes_w_extend_resolve(self):
+        db = self._makeDB()
+        tm1, conn1 = self._open(db)
+        conn1.root()['acc'] = self._makeOne([1, 2, 3], chunk_size=2)
+        tm1.commit()
+        tm2, conn2 = self._open(db)
+        acc1 = conn1.root()['acc']
+        acc1.extend([4, 5])
+        self.assertEqual(acc1.consume(), [1, 2, 3, 4, 5]) # retires [3, 4]
+        self.assertEqual(conn2.root()['acc'].consume(), [1, 2, 3])
+        tm1.commit()
+        tm2.commit()
+        tm3, conn3 = self._open(db)
+        acc = conn3.root()['acc']
+        self.assertEqual(list(acc), [])
+        self.assertEqual(len(acc), 0)
+        acc.append(6)
+        tm3.commit()
+        self.assertEqual(list(acc), [6])
+
+    def test_extend_w_raising_iterable_leaves_tail_unchanged(self):
+        db = self._makeDB()
+        tm, conn = self._open(db)
+        acc = conn.root()['acc'] = self._makeOne([1], chunk_size=4)
+        tm.commit()
+        def _items():
+            yield 2
+            raise ValueError()
+        self.assertRaises(ValueError, acc.extend, _items())
+        self.assertEqual(list(acc), [1])
+        self.assertFalse(acc._chunks[0]._p_changed)
+
+    def test_append_to_retired_chunk_conflicts(self):
+        from ZODB.POSException import ConflictError
+        db = self._makeDB()
+        tm1, conn1 = self._open(db)
+        conn1.root()['acc'] = self._makeOne(range(3), chunk_size=4)
+        tm1.commit()
+        tm2, conn2 = self._open(db)
+        stale = conn2.root()['acc']
+        self.assertEqual(list(stale), [0, 1, 2])
+        # Fill the first chunk, add another, then consume both.
+        conn1.root()['acc'].extend([3, 4])
+        tm1.commit()
+        conn1.root()['acc'].consume()
+        tm1.commit()
+        stale.append(5)
+        self.assertRaises(ConflictError, tm2.commit)
+        tm2.abort()
+
+    def test_consume_w_max_items_writes_only_touched_chunks(self):
+        db = self._makeDB()
+        tm, conn = self._open(db)
+        acc = conn.root()['acc'] = self._makeOne(range(10), chunk_size=2)
+        tm.commit()
+        chunks = acc._chunks[:]
+        self.assertEqual(acc.consume(3), [0, 1, 2])
+        self.assertEqual([bool(x._p_changed) for x in chunks],
+                         [True, True, False, False, False])
+        tm.commit()
+        tm, conn = self._open(db)
+        self.assertEqual(list(conn.root()['acc']), list(range(3, 10)))
+
+    def test_concurrent_drains_resolve(self):
+        db = self._makeDB()
+        tm1, conn1 = self._open(db)
+        conn1.root()['acc'] = self._makeOne(range(10), chunk_size=2)
+        tm1.commit()
+        tm2, conn2 = self._open(db)
+        self.assertEqual(conn1.root()['acc'].consume(5), [0, 1, 2, 3, 4])
+        self.assertEqual(conn2.root()['acc'].consume(3), [0, 1, 2])
+        conn2.root()['acc'].append(10)
+        tm1.commit()
+        tm2.commit()
+        tm3, conn3 = self._open(db)
+        acc = conn3.root()['acc']
+        self.assertEqual(list(acc), [5, 6, 7, 8, 9, 10])
+        self.assertEqual(len(acc), 6)
+
+    def test_consume_empty_doesnt_write_tail(self):
+        db = self._makeDB()
+        tm, conn = self._open(db)
+        acc = conn.root()['acc'] = self._makeOne(chunk_size=2)
+        tm.commit()
+        self.assertEqual(acc.consume(), [])
+        self.assertFalse(acc._p_changed)
+        self.assertFalse(acc._chunks[0]._p_changed)
+
+    def test_append_after_retirement_races_empty_consume(self):
+        from ZODB.POSException import ConflictError
+        db = self._makeDB()
+        tm_a, conn_a = self._open(db)
+        conn_a.root()['acc'] = self._makeOne(chunk_size=2)
+        tm_a.commit()
+        tm_b, conn_b = self._open(db)
+        acc_b = conn_b.root()['acc']
+        acc_b._chunks[-1]._list = [] # rewrite the empty tail, as before
+        tm_b.commit()
+        acc_a = conn_a.root()['acc']
+        acc_a.extend([3, 4, 5])
+        acc_a.consume() # retires the (empty) first chunk
+        tm_a.commit()
+        acc_b.extend([13, 14]) # B's view predates A's commit
+        self.assertRaises(ConflictError, tm_b.commit)
+        tm_b.abort()
+        conn_b.root()['acc'].extend([13, 14])
+        tm_b.commit()
+        tm, conn = self._open(db)
+        self.assertEqual(list(conn.root()['acc']), [13, 14])
+
+
+class AccumulatorDBTests(_DBTestBase, unittest.TestCase):
+
+    def test_drain_w_concurrent_appends(self):
+        from appendonly import Accumulator
+        db = self._makeDB()
+        tm1, conn1 = self._open(db)
+        conn1.root()['acc'] = Accumulator(range(10))
+        tm1.commit()
+        tm2, conn2 = self._open(db)
+        drained = []
+        for batch in conn1.root()['acc'].drain(4):
+            drained.extend(batch)
+            if len(drained) < 10:
+                conn2.root()['acc'].append('x%d' % len(drained))
+                tm2.commit()
+            tm1.commit()
+        tm3, conn3 = self._open(db)
+        self.assertEqual(drained, list(range(10)) + ['x4', 'x8'])
+        self.assertEqual(list(conn3.root()['acc']), [])
+
+    def test_consume_past_old_then_append_from_committed(self):
+        from appendonly import Accumulator
+        db = self._makeDB()
+        tm, conn = self._open(db)
+        conn.root()['acc'] = Accumulator(['a', 'b'])
+        tm.commit()
+        tm_c, conn_c = self._open(db)
+        tm_n, conn_n = self._open(db)
+        conn_n.root()['acc'].append('y')      # N reads the old state
+        conn_c.root()['acc'].extend(['x', 'w'])
+        tm_c.commit()
+        tm_t, conn_t = self._open(db)
+        conn_t.root()['acc'].append('z')      # T reads committed
+        self.assertEqual(conn_n.root()['acc'].consume(), ['a', 'b', 'y'])
+        tm_n.commit()
+        tm_t.commit()
+        tm, conn = self._open(db)
+        self.assertEqual(list(conn.root()['acc']), ['x', 'w', 'z'])
@@ -44,9 +44,11 @@ setup(name='appendonly',
       url='',
       keywords='zodb',
       packages=find_packages(),
+      package_data={'appendonly.benchmarks': ['baseline.json']},
       include_package_data=True,
       zip_safe=False,
       install_requires = [
+        'BTrees',
         'persistent',
         'ZODB',
         'zope.interface',